@@ -0,0 +1,252 @@
+# hotpaths.py
+# 用途：純 Python 熱點的微基準測試，以合成資料（大量車輛、2x2 到超大自訂網格、大量通知）量測
+# garbage_collect、detect_location、precompute_boxes、update_config 網格產生與 draw_rectangle，不載入任何 YOLO 權重。
+# 每次結果附上 commit 追加到 JSONL 歷史檔，可以比較不同 commit 的差異
+#
+# 使用方式：
+#   python benchmarks/hotpaths.py                 # 執行全部並追加到歷史檔
+#   python benchmarks/hotpaths.py --quick --compare
+#   python benchmarks/hotpaths.py --filter detect_location --no-save
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import numpy as np
+from module.detection import DetectionManager
+from module.location import LocationManager
+from module.communication import NotificationManager
+from module.track import Vehicle, TrackStore
+
+HISTORY_PATH = os.path.join(os.path.dirname(__file__), "results", "hotpaths.jsonl")
+FRAME_SIZE = (1280, 720)
+
+
+def grid_layout(size:int, jitter:float=0.0, seed:int=0) -> dict:
+    """產生佔滿 1280x720 畫面的 size x size 網格配置；jitter 大於 0 時隨機偏移框框，使其不是規則網格"""
+    positions = LocationManager.compute_positions(size, 0, 0, FRAME_SIZE[0] / size, FRAME_SIZE[1] / size)
+    if jitter:
+        rng = random.Random(seed)
+        cell = min(FRAME_SIZE[0], FRAME_SIZE[1]) / size
+        for position in positions.values():
+            dx, dy = int(rng.uniform(-jitter, jitter) * cell), int(rng.uniform(-jitter, jitter) * cell)
+            position[:] = [position[0] + dx, position[1] + dy, position[2] + dx, position[3] + dy]
+    return {frame_key: {"position": position, "manager": {}} for frame_key, position in positions.items()}
+
+
+def random_vehicles(count:int, now:float, seed:int=0) -> list:
+    """在畫面中隨機產生車輛"""
+    rng = random.Random(seed)
+    vehicles = []
+    for vehicle_id in range(count):
+        x0, y0 = rng.randrange(0, FRAME_SIZE[0] - 60), rng.randrange(0, FRAME_SIZE[1] - 40)
+        vehicles.append(Vehicle(vehicle_id, "truck", (x0, y0, x0 + rng.randrange(20, 60), y0 + rng.randrange(15, 40)), now))
+    return vehicles
+
+
+def autorange(function, minimum:float=0.05) -> int:
+    """找出讓一輪執行超過 minimum 秒的呼叫次數，與 timeit.Timer.autorange 相同的做法"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= minimum or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+def measure(function, setup=None, repeat:int=5) -> dict:
+    """量測一次呼叫的耗時
+
+    Args:
+        function (callable): 非破壞性的函式直接重複呼叫；有 setup 時為 function(state)，每輪只呼叫一次
+        setup (callable, optional): 每輪執行前重新建立狀態，用於會改變狀態的函式（例如回收車輛）
+        repeat (int): 量測輪數
+
+    Returns:
+        dict: {"median_us", "min_us", "number"}
+    """
+    samples = []
+    number = 1
+    if setup is None:
+        number = autorange(function)
+    for _ in range(repeat):
+        if setup is not None:
+            state = setup()
+            start = time.perf_counter()
+            function(state)
+            samples.append(time.perf_counter() - start)
+        else:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            samples.append((time.perf_counter() - start) / number)
+    return {"median_us": float(np.median(samples) * 1e6), "min_us": float(min(samples) * 1e6), "number": number}
+
+
+class HotpathBenchmarks:
+    """建立合成的配置與模組（DetectionManager 延遲載入模型、LocationManager 不做定位），產生所有測試案例"""
+    def __init__(self, quick:bool=False):
+        self.grid_sizes = [2, 4, 8] if quick else [2, 3, 4, 8, 16, 32]
+        self.track_counts = [1000, 10000] if quick else [1000, 10000, 100000]
+        self.vehicle_counts = [10, 100] if quick else [10, 100, 1000]
+        self.alert_counts = [1, 10] if quick else [1, 10, 100]
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.temp_dir.name, "window_admin_settings.json")
+        config = {"{0}x{0}".format(size): grid_layout(size) for size in self.grid_sizes}
+        config["irregular"] = grid_layout(max(self.grid_sizes), jitter=0.2) # 不是規則網格，走向量化的備用判斷
+        with open(self.config_path, "w", encoding="utf-8") as config_file:
+            json.dump(config, config_file, ensure_ascii=False)
+        self.layouts = list(config.keys())
+        self.detections = {layout: DetectionManager(vehicle_detect_model_path=None, config_path=self.config_path,
+                                                    window_layout_str=layout, lazy_load=True)
+                           for layout in self.layouts}
+        self.location = LocationManager(self.config_path, monitor=None, auto_initialize=False)
+        self.communication = NotificationManager(config_path=self.config_path, window_layout_str=self.layouts[0])
+        self.frame = np.random.default_rng(0).integers(0, 255, (FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+
+    def close(self) -> None:
+        self.communication.close(wait=False)
+        self.temp_dir.cleanup()
+
+    def cases(self):
+        """產生 (名稱, 參數, 量測函式) 的測試案例"""
+        detection = self.detections[self.layouts[0]]
+        for count in self.track_counts:
+            for expired in (0.0, 0.5):
+                yield "garbage_collect", {"tracks": count, "expired": expired}, lambda count=count, expired=expired: self.bench_garbage_collect(detection, count, expired)
+        for layout in self.layouts:
+            for count in self.vehicle_counts:
+                yield "detect_location", {"layout": layout, "vehicles": count}, lambda layout=layout, count=count: self.bench_detect_location(layout, count)
+        for layout in self.layouts:
+            yield "precompute_boxes", {"layout": layout}, lambda layout=layout: measure(self.detections[layout].precompute_boxes)
+        for size in self.grid_sizes:
+            yield "compute_positions", {"size": size}, lambda size=size: measure(lambda: LocationManager.compute_positions(size, 0, 0, FRAME_SIZE[0] / size, FRAME_SIZE[1] / size))
+            yield "update_config", {"size": size}, lambda size=size: self.bench_update_config(size)
+        vehicles = random_vehicles(max(self.alert_counts), time.monotonic())
+        yield "draw_rectangle", {"vehicles": 1}, lambda: measure(lambda: self.communication.draw_rectangle(self.frame, vehicles[0]))
+        for count in self.alert_counts:
+            yield "draw_rectangles", {"vehicles": count, "frame_key": False}, lambda count=count: measure(lambda: self.communication.draw_rectangles(self.frame, vehicles[:count]))
+            yield "draw_rectangles", {"vehicles": count, "frame_key": True}, lambda count=count: measure(lambda: self.communication.draw_rectangles(self.frame, vehicles[:count], frame_key=0))
+
+    def bench_garbage_collect(self, detection:DetectionManager, count:int, expired:float) -> dict:
+        """count 台車輛，其中 expired 比例已經超過 limit_time"""
+        def setup():
+            now = time.monotonic()
+            detection.tracks = TrackStore(detection.limit_time)
+            for index, vehicle in enumerate(random_vehicles(count, now)):
+                if index < count * expired:
+                    vehicle.last_seen = now - detection.limit_time - 1
+                detection.tracks.add(vehicle)
+            return now
+        tracks = detection.tracks
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # 回收時每台車輛都會輸出訊息
+                return measure(detection.garbage_collect, setup=setup)
+        finally:
+            detection.tracks = tracks
+
+    def bench_detect_location(self, layout:str, count:int) -> dict:
+        detection = self.detections[layout]
+        vehicles = {vehicle.vehicle_id: vehicle for vehicle in random_vehicles(count, time.monotonic())}
+        return measure(lambda: detection.detect_location(vehicles))
+
+    def bench_update_config(self, size:int) -> dict:
+        """產生網格並寫回配置文件（包含 JSON 寫檔）"""
+        object_name = "{0}x{0}".format(size)
+        return measure(lambda: self.location.update_config(object_name, size, 0, 0, FRAME_SIZE[0] / size, FRAME_SIZE[1] / size))
+
+
+def git_commit():
+    """目前的 commit 與是否有未提交的修改，不在 git 中時回傳 (None, None)"""
+    root = os.path.join(os.path.dirname(__file__), "..")
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_history(path:str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def case_key(result:dict) -> str:
+    return "{} {}".format(result["name"], json.dumps(result["params"], sort_keys=True, ensure_ascii=False))
+
+
+def run_benchmarks(args) -> dict:
+    benchmarks = HotpathBenchmarks(quick=args.quick)
+    results = []
+    try:
+        for name, params, run in benchmarks.cases():
+            if args.filter and args.filter not in name:
+                continue
+            result = {"name": name, "params": params}
+            result.update(run())
+            results.append(result)
+            print("{:<60} {:>12.1f} us".format(case_key(result), result["median_us"]))
+    finally:
+        benchmarks.close()
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "quick": args.quick,
+        "results": results,
+    }
+
+
+def compare(entry:dict, previous:dict) -> None:
+    """與上一筆歷史比較，輸出每個案例的倍率（大於 1 表示變慢）"""
+    before = {case_key(result): result["median_us"] for result in previous["results"]}
+    print("\n與 {}（{}）比較：".format(previous.get("commit"), previous.get("timestamp")))
+    for result in entry["results"]:
+        key = case_key(result)
+        if key in before and before[key] > 0:
+            ratio = result["median_us"] / before[key]
+            print("{:<60} {:>7.2f}x{}".format(key, ratio, "  ← 變慢" if ratio > 1.2 else ""))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="純 Python 熱點的微基準測試")
+    parser.add_argument("--quick", action="store_true", help="只執行較小的規模")
+    parser.add_argument("--filter", default=None, help="只執行名稱包含此字串的案例")
+    parser.add_argument("--history", default=HISTORY_PATH, help="歷史檔路徑（JSONL）")
+    parser.add_argument("--no-save", action="store_true", help="不追加到歷史檔")
+    parser.add_argument("--compare", action="store_true", help="與歷史檔中相同規模的上一筆結果比較")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    history = load_history(args.history)
+    entry = run_benchmarks(args)
+    if args.compare:
+        previous = next((item for item in reversed(history) if item.get("quick") == entry["quick"]), None)
+        if previous is not None:
+            compare(entry, previous)
+        else:
+            print("\n歷史檔中沒有可比較的結果")
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,267 @@
+# replay.py
+# 用途：無畫面的完整管線基準測試，將影片或合成的拼接畫面依序送過 擷取 → 偵測 → 定位 → 通知，
+# 輸出每個階段的延遲百分位數、持續 FPS、記憶體峰值與通知數量（JSON），用於比較模型與設定、發現效能退化
+#
+# 使用方式：
+#   python benchmarks/replay.py --video data/test_video1.mp4 --layout 4x4 --output log/replay.json
+#   python benchmarks/replay.py --synthetic --frames 300 --layout 3x3 --mode tiles --backend onnx
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import Future
+import numpy as np
+import cv2
+from module.monitor import MonitorManager
+from module.detection import DetectionManager
+from module.location import LocationManager
+from module.communication import AlertCoalescer, SnapshotEncoder
+
+
+class SyntheticMosaic:
+    """合成的拼接畫面，介面與 cv2.VideoCapture 的 read() 相同，可以直接取代 MonitorManager.cap。
+    每個格子有固定的背景與緩慢移動的方塊，模擬有車輛經過的監視器畫面
+    """
+    def __init__(self, layout_size:int=4, frames:int=300, vehicles_per_cell:int=1, frame_size:tuple=(1280, 720), seed:int=0):
+        self.layout_size = layout_size
+        self.frames = frames
+        self.frame_size = frame_size
+        self.index = 0
+        rng = np.random.default_rng(seed)
+        width, height = frame_size
+        self.background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+        cell_width, cell_height = width // layout_size, height // layout_size
+        for k in range(1, layout_size): # 格子之間的邊框
+            cv2.line(self.background, (k * cell_width, 0), (k * cell_width, height - 1), (0, 0, 0), 2)
+            cv2.line(self.background, (0, k * cell_height), (width - 1, k * cell_height), (0, 0, 0), 2)
+        # 每台車輛：(格子左上角, 起點, 速度, 大小, 顏色)
+        self.vehicles = []
+        for row in range(layout_size):
+            for column in range(layout_size):
+                for _ in range(vehicles_per_cell):
+                    size = (int(cell_width * rng.uniform(0.2, 0.35)), int(cell_height * rng.uniform(0.2, 0.35)))
+                    self.vehicles.append(((column * cell_width, row * cell_height), rng.uniform(0, 1, 2), rng.uniform(-0.01, 0.01, 2),
+                                          size, tuple(int(c) for c in rng.integers(0, 255, 3))))
+        self.cell_size = (cell_width, cell_height)
+
+    def read(self):
+        if self.index >= self.frames:
+            return False, None
+        frame = self.background.copy()
+        cell_width, cell_height = self.cell_size
+        for (origin_x, origin_y), start, velocity, (box_width, box_height), color in self.vehicles:
+            fraction = np.abs((start + velocity * self.index) % 2 - 1) # 在格子內來回移動
+            x0 = origin_x + int(fraction[0] * (cell_width - box_width))
+            y0 = origin_y + int(fraction[1] * (cell_height - box_height))
+            cv2.rectangle(frame, (x0, y0), (x0 + box_width, y0 + box_height), color, -1)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        return None
+
+
+class StubNotificationManager:
+    """不發送任何訊息的 NotificationManager，只記錄通知數量；encoder 不為 None 時仍會編碼通知圖片以計入成本"""
+    def __init__(self, snapshot_encoder:SnapshotEncoder=None):
+        self.snapshot_encoder = snapshot_encoder
+        self.sent = 0 # 合併後送出的訊息數
+        self.vehicles = 0 # 訊息中包含的車輛數
+        self.per_window = {} # {視窗 ID: 訊息數}
+
+    def get_manager_info(self, window_id:str) -> dict:
+        return {}
+
+    def submit_notification(self, window_id:str, message:str, image=None, vehicle=None, vehicles=None, frame_key=None) -> Future:
+        vehicles = list(vehicles) if vehicles else ([vehicle] if vehicle is not None else [])
+        if self.snapshot_encoder is not None and image is not None:
+            self.snapshot_encoder.encode(image, vehicles, frame_key)
+        self.sent += 1
+        self.vehicles += len(vehicles)
+        self.per_window[window_id] = self.per_window.get(window_id, 0) + 1
+        future = Future()
+        future.set_result(True)
+        return future
+
+
+class StageTimer:
+    """記錄每個階段每次執行的耗時"""
+    def __init__(self):
+        self.samples = {} # {階段名稱: [秒數]}
+
+    def record(self, stage:str, seconds:float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage:str, function):
+        """包裝函式，每次呼叫時記錄耗時"""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> dict:
+        """每個階段的次數、平均與百分位數（毫秒）"""
+        result = {}
+        for stage, samples in self.samples.items():
+            values = np.array(samples) * 1000
+            result[stage] = {
+                "count": len(values),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p90_ms": float(np.percentile(values, 90)),
+                "p99_ms": float(np.percentile(values, 99)),
+                "max_ms": float(values.max()),
+            }
+        return result
+
+
+def peak_rss_mb():
+    """行程的記憶體峰值（MB），無法取得時回傳 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # macOS 單位為 bytes，Linux 為 KB
+    except ImportError:
+        pass
+    try:
+        import psutil # Windows 沒有 resource 模組
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def write_synthetic_config(window_layout_str:str) -> str:
+    """依照佈局產生佔滿 1280x720 畫面的網格配置，回傳暫存檔路徑"""
+    size = int(window_layout_str.split("x")[0])
+    positions = LocationManager.compute_positions(size, 0, 0, 1280 / size, 720 / size)
+    config = {window_layout_str: {frame_key: {"position": position, "manager": {}} for frame_key, position in positions.items()}}
+    config_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8")
+    with config_file:
+        json.dump(config, config_file, indent=4, ensure_ascii=False)
+    return config_file.name
+
+
+def run_replay(args) -> dict:
+    """執行一次回放基準測試
+
+    Returns:
+        dict: 測試設定與結果
+    """
+    config_path = args.config or write_synthetic_config(args.layout)
+    monitor = MonitorManager(window_name=args.monitor, video_path=None if args.synthetic else args.video)
+    if args.synthetic:
+        monitor.cap = SyntheticMosaic(layout_size=int(args.layout.split("x")[0]), frames=args.frames + args.warmup, seed=args.seed)
+    load_start = time.perf_counter()
+    detection = DetectionManager(vehicle_detect_model_path=args.model, config_path=config_path, window_layout_str=args.layout,
+                                 backend=args.backend, backend_options={"num_threads": args.threads} if args.threads else None)
+    detection.set_inference_mode(args.mode)
+    detection.motion_gate = not args.no_motion_gate
+    load_seconds = time.perf_counter() - load_start
+    notifier = StubNotificationManager(SnapshotEncoder() if args.encode else None)
+    coalescer = AlertCoalescer(notifier)
+
+    # 以包裝函式記錄偵測內部每個階段的耗時
+    timer = StageTimer()
+    detection.detect_motion = timer.wrap("motion", detection.detect_motion)
+    detection.track_mosaic = timer.wrap("track", detection.track_mosaic)
+    detection.track_tiles = timer.wrap("track", detection.track_tiles)
+    detection.detect_location = timer.wrap("locate", detection.detect_location)
+
+    frames = 0
+    alerts = 0
+    start = None
+    for index in range(args.warmup + args.frames):
+        if index == args.warmup: # 暖機的結果不列入統計
+            timer.samples.clear()
+            start = time.perf_counter()
+        frame_start = time.perf_counter()
+        frame = monitor.temp_get_frame()
+        if frame is None:
+            break
+        timer.record("capture", time.perf_counter() - frame_start)
+        detect_start = time.perf_counter()
+        detected = detection.detect(frame)
+        timer.record("detect", time.perf_counter() - detect_start)
+        if detected is None:
+            continue
+        results, anno_frame = detected
+        if args.render:
+            render_start = time.perf_counter()
+            anno_frame.render()
+            timer.record("render", time.perf_counter() - render_start)
+        notify_start = time.perf_counter()
+        for frame_id, vehicle in results:
+            coalescer.add({"window_id": frame_id, "vehicle": vehicle, "image": frame, "frame_key": index, "message": "發現車輛"})
+        coalescer.flush_due()
+        timer.record("notify", time.perf_counter() - notify_start)
+        timer.record("total", time.perf_counter() - frame_start)
+        if index >= args.warmup:
+            frames += 1
+            alerts += len(results)
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    coalescer.flush_due(force=True)
+    if not args.config:
+        os.remove(config_path)
+
+    return {
+        "source": "synthetic" if args.synthetic else args.video,
+        "layout": args.layout,
+        "mode": args.mode,
+        "backend": args.backend,
+        "profile": detection.profile,
+        "motion_gate": detection.motion_gate,
+        "model_load_s": load_seconds,
+        "frames": frames,
+        "elapsed_s": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "stages": timer.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "alerts": {
+            "raw": alerts, # 偵測到的新車輛數
+            "sent": notifier.sent, # 合併與頻率限制後送出的訊息數
+            "vehicles_in_messages": notifier.vehicles,
+            "per_window": notifier.per_window,
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="回放影片或合成畫面，量測完整管線的效能")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video", default=os.path.join("data", "test_video1.mp4"), help="回放的影片路徑")
+    source.add_argument("--synthetic", action="store_true", help="使用合成的拼接畫面")
+    parser.add_argument("--frames", type=int, default=300, help="量測的影像數（影片較短時以影片長度為準）")
+    parser.add_argument("--warmup", type=int, default=10, help="不列入統計的暖機影像數")
+    parser.add_argument("--layout", default="4x4", help="視窗佈局")
+    parser.add_argument("--config", default=None, help="配置文件，未指定時依照佈局產生佔滿畫面的網格")
+    parser.add_argument("--model", default=None, help="車輛偵測模型，未指定時依照佈局選擇")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"], help="推論後端")
+    parser.add_argument("--threads", type=int, default=None, help="推論的運算執行緒數（torch.set_num_threads 或 ONNX Runtime）")
+    parser.add_argument("--mode", default="mosaic", choices=["mosaic", "tiles"], help="推論模式")
+    parser.add_argument("--monitor", default="主視窗", help="MonitorManager 綁定的螢幕名稱")
+    parser.add_argument("--no-motion-gate", action="store_true", help="停用動態閘門，每張影像都推論")
+    parser.add_argument("--render", action="store_true", help="每張影像都繪製標註影像")
+    parser.add_argument("--encode", action="store_true", help="通知時編碼通知圖片")
+    parser.add_argument("--seed", type=int, default=0, help="合成畫面的亂數種子")
+    parser.add_argument("--output", default=None, help="輸出 JSON 的路徑，未指定時輸出到標準輸出")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_replay(args)
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(text)
+    else:
+        print(text)
@@ -21,13 +21,22 @@ import sys
 from module.monitor import MonitorManager
 from module.detection import DetectionManager
 from module.location import LocationManager
-from module.communication import NotificationManager
+from module.communication import NotificationManager, NotificationRouter, AlertCoalescer
+from module.notification_queue import NotificationQueue
+from module.scheduler import FrameScheduler
+from module.metrics import REGISTRY, MetricsHTTPServer, MetricsFileWriter
+from module.profiler import SamplingProfiler
+from module.event_store import EventStore
+from module.pipeline import MultiMonitorPipeline, load_pipeline_configs, build_notifications
 import json
 from utils.log import setup_logger
 import subprocess
-import cv2
+import numpy as np
 import time
 import queue
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 
 # 設置日誌處理器，支持指定編碼
 logging = setup_logger('main', 'main.log')
@@ -37,25 +46,227 @@ class NotificationThread(QThread):
         super().__init__()
         self.notificationQueue = notificationQueue
         self.communication_module = communication_module
+        # 合併同一視窗的通知並限制發送頻率，發送結果記錄到佇列的統計
+        self.coalescer = AlertCoalescer(communication_module, on_result=notificationQueue.mark_result)
+        self.running = False
+
+    def start(self, *args, **kwargs):
+        """在執行緒開始前設定 running，與 InferenceThread 相同"""
+        self.running = True
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        """停止通知執行緒，將佇列中剩下的通知合併後立即發送（仍遵守頻率限制），再關閉發送執行緒池"""
+        self.running = False
+        self.wait()
+        while True:
+            try:
+                self.coalescer.add(self.notificationQueue.get(block=False))
+            except queue.Empty:
+                break
+        self.coalescer.flush_due(force=True)
+        if self.coalescer.pending:
+            logging.warning("NotificationThread.stop:超過發送頻率限制，{} 個視窗的通知未發送".format(len(self.coalescer.pending)))
+        self.communication_module.close() # 等待送出中的通知完成
 
     def run(self):
+        threading.current_thread().name = "NotificationThread" # 取樣分析時以名稱區分執行緒
         try:
-            
-            while True:
-                logging.info("NotificationThread.run:通知執行緒啟動！")
-                # 從隊列中取出消息
-                notification_data = self.notificationQueue.get(block=True)
-                if notification_data is None:
-                    continue
-                # 處理通知（例如，發送LINE notify）
-                self.communication_module.send_notification(window_id=notification_data["window_id"],
-                                                            message=notification_data["message"],
-                                                            image=notification_data["imgae"],
-                                                                vehicle=notification_data["vehicle"])
-                self.notificationQueue.task_done() # 通知隊列，消息處理完成
+            logging.info("NotificationThread.run:通知執行緒啟動！")
+            while self.running:
+                # 從隊列中取出消息，等待時間不超過下一則合併通知的發送時間
+                try:
+                    notification_data = self.notificationQueue.get(block=True, timeout=self.coalescer.next_timeout())
+                except queue.Empty:
+                    notification_data = None
+                if notification_data is not None:
+                    # 先合併同一視窗的通知
+                    self.coalescer.add(notification_data)
+                    self.notificationQueue.task_done() # 通知隊列，消息處理完成
+                # 處理通知（例如，發送LINE notify），交給執行緒池同時發送，送出中的通知過多時會在這裡等待
+                self.coalescer.flush_due()
         except Exception as e:
             logging.error(f"NotificationThread.run 錯誤：{e}")
 
+class InferenceThread(QThread):
+    """推論執行緒，擁有 MonitorManager 與 DetectionManager，在 GUI 執行緒之外擷取與偵測，
+    完成的標註影像以信號交給主視窗顯示；主視窗還沒顯示完上一張時，新的影像直接丟棄不排隊
+    """
+    frame_ready = pyqtSignal(object, object)  # (標註影像, 偵測結果)
+    error_occurred = pyqtSignal(str)  # 發生錯誤時發射的信號
+
+    def __init__(self, monitor_module, detection_module, notificationQueue, scheduler=None, display_interval=0.1):
+        super().__init__()
+        self.monitor_module = monitor_module
+        self.detection_module = detection_module
+        self.notificationQueue = notificationQueue
+        self.scheduler = scheduler or FrameScheduler() # 依照延遲與畫面活動決定推論間隔
+        self.last_capture_time = None # 最近一次處理的影像的擷取時間
+        self.running = False
+        self.display_pending = False # 主視窗是否還在處理上一張影像
+        self.display_enabled = True # 視窗最小化時由主視窗設為 False，不送出預覽影像
+        self.display_interval = display_interval # 預覽影像的最短送出間隔秒數，與推論速度無關
+        self.last_display_time = 0 # 上一次送出預覽影像的時間
+        self.dropped_display_frames = 0 # 因為主視窗來不及顯示而丟棄的影像數
+        self.last_error_time = 0 # 上一次發射錯誤信號的時間，避免錯誤訊息洗版
+        self.error_interval = 10 # 兩次錯誤信號的最短間隔秒數
+        self.frame_stage = REGISTRY.stage("frame") # 一張影像從取得到送出通知與預覽的耗時
+        self.dropped_counter = REGISTRY.counter("frames_dropped_total", "擷取後來不及推論而被覆蓋的影像數")
+        self.display_dropped_counter = REGISTRY.counter("display_frames_dropped_total", "主視窗來不及顯示而丟棄的預覽影像數")
+
+    def display_done(self):
+        """主視窗顯示完畢後呼叫，允許送出下一張影像"""
+        self.display_pending = False
+
+    def start(self, *args, **kwargs):
+        """在執行緒開始前設定 running，start() 之後立即呼叫 stop() 時不會被 run() 覆蓋"""
+        self.running = True
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        """停止推論執行緒並等待結束"""
+        self.running = False
+        self.wait()
+
+    def run(self):
+        threading.current_thread().name = "InferenceThread" # 取樣分析時以名稱區分執行緒
+        self.display_pending = False
+        last_frame_seq = None
+        # 只擷取網格範圍時，框框已轉換為區域影像的座標，必須以同一個區域擷取螢幕
+        if self.monitor_module.capture_region is not None:
+            grab = lambda: self.monitor_module.capture_frame(use_region=True)
+        else:
+            grab = self.monitor_module.temp_get_frame
+        self.monitor_module.start_capture(grab=grab) # 啟動背景擷取執行緒
+        try:
+            while self.running:
+                start = time.monotonic()
+                try:
+                    frame_seq = self.process_frame(last_frame_seq)
+                    if frame_seq != last_frame_seq:
+                        # 畫面上還有追蹤中的車輛時視為活動，提高推論頻率
+                        self.scheduler.frame_done(start, active=len(self.detection_module.tracks) > 0,
+                                                  captured=self.last_capture_time)
+                    last_frame_seq = frame_seq
+                except Exception as e:
+                    logging.error("'InferenceThread.run' 方法發生錯誤：{}".format(e))
+                    if time.monotonic() - self.last_error_time > self.error_interval:
+                        self.last_error_time = time.monotonic()
+                        self.error_occurred.emit(f"process_frame 錯誤發生({e})!")
+                time.sleep(self.scheduler.next_delay(start))
+        finally:
+            self.monitor_module.stop_capture() # 停止背景擷取執行緒
+
+    def process_frame(self, last_frame_seq):
+        """處理一張影像，將通知放入佇列，並在主視窗有空時送出標註影像
+
+        Args:
+            last_frame_seq (int): 上一次處理的影像序號，避免重複處理同一張影像
+
+        Returns:
+            int: 這次處理的影像序號
+        """
+        packet = self.monitor_module.get_latest_frame(last_seq=last_frame_seq, timeout=0.5) # 從環形緩衝區取得最新影像
+        if packet is None: # 尚未有新影像，等待下一次
+            return last_frame_seq
+        frame_seq, self.last_capture_time, frame = packet
+        if last_frame_seq is not None and frame_seq - last_frame_seq > 1: # 中間的影像已被新影像覆蓋
+            self.dropped_counter.inc(frame_seq - last_frame_seq - 1)
+        with self.frame_stage.time():
+            return self.handle_frame(frame_seq, frame)
+
+    def handle_frame(self, frame_seq, frame):
+        """偵測一張影像，將通知放入佇列，並在主視窗有空時送出標註影像"""
+        detected = self.detection_module.detect(frame, frame_key=frame_seq) # 偵測物體，並回傳落在哪個區塊
+        if detected is None:
+            return frame_seq
+        results, anno_frame = detected
+        if results:
+            for result in results:
+                frame_id, vehicle = result
+                notification_data={
+                    "window_id": frame_id,
+                    "vehicle": vehicle,
+                    "image": frame, # 同一張影像的通知共用同一個陣列，編碼時以 frame_key 共用縮圖
+                    "frame_key": frame_seq,
+                    "message": "發現車輛"
+                }
+                logging.info(f"偵測到車輛，落於：{frame_id}號框, 車輛 ID：{vehicle.vehicle_id}, 車輛類別：{vehicle.vehicle_type}, 車輛位置：{vehicle.position}")
+                self.notificationQueue.put(notification_data) # 將通知放入佇列
+        # 視窗最小化或還沒到預覽更新時間時不送出；主視窗跟不上時丟棄這張影像，不讓信號排隊
+        now = time.monotonic()
+        if not self.display_enabled or now - self.last_display_time < self.display_interval:
+            return frame_seq
+        if self.display_pending:
+            self.dropped_display_frames += 1
+            self.display_dropped_counter.inc()
+        else:
+            self.display_pending = True
+            self.last_display_time = now
+            self.frame_ready.emit(anno_frame.render(), results) # 只有送出顯示的影像才繪製標註，且在推論執行緒中繪製
+        return frame_seq
+
+class PipelineThread(QThread):
+    """其他螢幕的管線執行緒。擷取與偵測在每個螢幕各自的子行程中進行（MultiMonitorPipeline），
+    這個執行緒只把結果中的通知排入共用的通知佇列，並把預覽影像以信號交給主視窗；
+    主視窗還沒顯示完同一個螢幕的上一張時，新的影像直接丟棄
+    """
+    frame_ready = pyqtSignal(object, object)  # (螢幕名稱, 標註影像)
+    error_occurred = pyqtSignal(str)  # 發生錯誤時發射的信號
+
+    def __init__(self, pipeline_configs, notificationQueue, event_store_path=None, display_interval=0.1):
+        super().__init__()
+        self.pipeline = MultiMonitorPipeline()
+        for pipeline_config in pipeline_configs:
+            options = dict(pipeline_config)
+            options.setdefault("display_interval", display_interval)
+            options.setdefault("event_store_path", event_store_path) # 子行程寫入同一個偵測事件資料庫
+            self.pipeline.add_monitor(**options)
+        self.notificationQueue = notificationQueue
+        self.running = False
+        self.display_enabled = True # 視窗最小化時由主視窗設為 False，不送出預覽影像
+        self.display_pending = set() # 主視窗還在處理上一張影像的螢幕名稱
+
+    def display_done(self, monitor_name):
+        """主視窗顯示完畢後呼叫，允許送出該螢幕的下一張影像"""
+        self.display_pending.discard(monitor_name)
+
+    def start(self, *args, **kwargs):
+        """在執行緒開始前設定 running，與 InferenceThread 相同"""
+        self.running = True
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        """停止所有管線子行程並等待結束"""
+        self.running = False
+        self.wait()
+
+    def run(self):
+        threading.current_thread().name = "PipelineThread" # 取樣分析時以名稱區分執行緒
+        self.pipeline.start()
+        try:
+            while self.running:
+                message = self.pipeline.get_result(timeout=0.5)
+                if message is None:
+                    continue
+                monitor_name = message["monitor_name"]
+                if "error" in message:
+                    logging.error("'PipelineThread.run' {} 的管線發生錯誤：{}".format(monitor_name, message["error"]))
+                    self.error_occurred.emit(f"{monitor_name} 管線錯誤發生({message['error']})!")
+                    continue
+                for notification_data in build_notifications(message):
+                    vehicle = notification_data["vehicle"]
+                    logging.info(f"{monitor_name} 偵測到車輛，落於：{notification_data['window_id'][1]}號框, 車輛 ID：{vehicle.vehicle_id}, 車輛類別：{vehicle.vehicle_type}, 車輛位置：{vehicle.position}")
+                    self.notificationQueue.put(notification_data) # 與主螢幕共用通知佇列與合併器
+                if message["anno_frame"] is not None and self.display_enabled and monitor_name not in self.display_pending:
+                    self.display_pending.add(monitor_name)
+                    self.frame_ready.emit(monitor_name, message["anno_frame"])
+        except Exception as e:
+            logging.error("'PipelineThread.run' 方法發生錯誤：{}".format(e))
+            self.error_occurred.emit(f"PipelineThread 錯誤發生({e})!")
+        finally:
+            self.pipeline.stop()
+
 class WorkerThread(QThread):
     finished = pyqtSignal(dict)  # 任務完成時發射的信號
     updata_text = pyqtSignal(str)  # 更新載入視窗訊息的信號
@@ -67,6 +278,7 @@ class WorkerThread(QThread):
         self.monitor_module = None
         self.location_module = None
         self.detection_module = None
+        self.ultralytics_future = None # 啟動時匯入 ultralytics 的 Future，定位與偵測載入模型前等待
 
     def setupData(self, data): # 初始化資料
         self.config_path = data["config_path"]
@@ -74,34 +286,43 @@ class WorkerThread(QThread):
         self.window_layout_str = data["window_layout_str"]
         self.admin_data = data["admin_data"]
         self.monitor_choice = data["monitor_choice"]
+        self.roi_capture = data.get("roi_capture", False) # 是否只擷取網格範圍
+        self.inference_mode = data.get("inference_mode", "mosaic") # 推論模式，"mosaic" 或 "tiles"
+        self.inference_backend = data.get("inference_backend", "torch") # 推論後端，"torch" 或 "onnx"
+        self.backend_options = data.get("backend_options") # 推論後端的設定，例如 {"num_threads": 4}
+        self.auto_tune = data.get("auto_tune", False) # 是否在啟動時量測延遲，自動選擇模型與輸入大小
+        self.target_fps = data.get("target_fps", 10.0) # 自動調整的目標 FPS
 
     def run(self):
         try:
-            # 初始化模組
-            print("SetupWindow.on_confirm:初始化NotificationManager... \n ")
-            self.updata_text.emit("初始化NotificationManager...")
-                
-            self.communication_module = NotificationManager(config_path=self.config_path,
-                                                    window_layout_str=self.window_layout_str)
-            time.sleep(1)
-
-            print("SetupWindow.on_confirm:初始化MonitorManager... \n ")
-            self.updata_text.emit("初始化MonitorManager...")
-            self.monitor_module = MonitorManager(window_name=self.monitor_choice)
-            time.sleep(1)
-
-            print("SetupWindow.on_confirm:初始化LocationManager... \n ")
-            self.updata_text.emit("初始化LocationManager...")
-            self.location_module = LocationManager(config_path=self.config_path, 
-                                            monitor=self.monitor_module) 
-            time.sleep(1)
-            
-            print("SetupWindow.on_confirm:初始化DetectionManager... \n ")
-            self.updata_text.emit("初始化DetectionManager...")
-            self.detection_module = DetectionManager(vehicle_detect_model_path=self.vehicle_detect_model_path,
-                                                config_path=self.config_path,
-                                                window_layout_str=self.window_layout_str)
-            time.sleep(1)
+            # 互不相依的模組同時初始化：通知（讀取配置）、螢幕 → 定位（需要螢幕畫面）、偵測（載入模型）
+            # 定位與偵測都會匯入 ultralytics，同時匯入可能拿到初始化到一半的模組，因此先由一個執行緒匯入一次，
+            # 兩者等匯入完成後才載入模型，讀取配置與設定螢幕仍同時進行
+            self.phase_times = {} # {階段名稱: 耗時秒數}
+            start = time.perf_counter()
+            self.updata_text.emit("初始化模組中...")
+            with ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup") as executor:
+                self.ultralytics_future = executor.submit(self.timed_phase, "ultralytics", importlib.import_module, "ultralytics")
+                communication_future = executor.submit(self.timed_phase, "NotificationManager", NotificationManager,
+                                                       config_path=self.config_path, window_layout_str=self.window_layout_str)
+                location_future = executor.submit(self.init_monitor_and_location)
+                detection_future = executor.submit(self.init_detection)
+                self.communication_module = communication_future.result()
+                self.monitor_module, self.location_module = location_future.result()
+                self.detection_module = detection_future.result()
+
+            # 定位可能在偵測模組讀取配置後才改寫框框位置，兩者都完成後重新讀取一次
+            phase_start = time.perf_counter()
+            self.detection_module.reload_config()
+            self.detection_module.set_inference_mode(self.inference_mode)
+            if self.roi_capture:
+                # 只擷取網格範圍，框框座標需轉換為擷取影像的座標系
+                self.monitor_module.set_capture_region(self.config_path, self.window_layout_str)
+                self.detection_module.reload_boxes(self.monitor_module.map_config_boxes(self.detection_module.precomputed_boxes))
+            self.location_module.add_config_listener(self.on_config_updated) # 重新定位時同步更新偵測框框
+            self.phase_times["同步框框配置"] = time.perf_counter() - phase_start
+            self.phase_times["總計"] = time.perf_counter() - start
+            self.report_phase_times()
 
             data={
                 "communication_module": self.communication_module,
@@ -117,13 +338,62 @@ class WorkerThread(QThread):
 
             print("SetupWindow.on_confirm:初始化即將完成！ \n ")
             self.updata_text.emit("初始化即將完成！")
-            time.sleep(1)
-            
+
             self.finished.emit(data)  # 發出完成信號
         except Exception as e:
             logging.error("'run' 方法發生錯誤：{}".format(e))
+            self.updata_text.emit("初始化失敗：{}".format(e)) # 讓載入視窗顯示錯誤，而不是一直等待
             return None
 
+    def timed_phase(self, name, factory, *args, **kwargs):
+        """執行一個初始化階段並記錄耗時，在啟動執行緒池中執行
+
+        Args:
+            name (str): 階段名稱
+            factory (callable): 建立模組的函式或類別
+
+        Returns:
+            建立的模組
+        """
+        print("SetupWindow.on_confirm:初始化{}... \n ".format(name))
+        self.updata_text.emit("初始化{}...".format(name))
+        phase_start = time.perf_counter()
+        module = factory(*args, **kwargs)
+        self.phase_times[name] = time.perf_counter() - phase_start
+        self.updata_text.emit("{} 初始化完成（{:.2f} 秒）".format(name, self.phase_times[name]))
+        return module
+
+    def init_monitor_and_location(self):
+        """定位需要螢幕畫面，MonitorManager 完成後才初始化 LocationManager"""
+        monitor_module = self.timed_phase("MonitorManager", MonitorManager, window_name=self.monitor_choice)
+        self.ultralytics_future.result() # 定位可能需要載入定位模型
+        location_module = self.timed_phase("LocationManager", LocationManager, config_path=self.config_path, monitor=monitor_module)
+        return monitor_module, location_module
+
+    def init_detection(self):
+        """ultralytics 匯入完成後才初始化 DetectionManager（載入模型）"""
+        self.ultralytics_future.result()
+        return self.timed_phase("DetectionManager", DetectionManager,
+                                vehicle_detect_model_path=self.vehicle_detect_model_path,
+                                config_path=self.config_path,
+                                window_layout_str=self.window_layout_str,
+                                backend=self.inference_backend,
+                                backend_options=self.backend_options,
+                                auto_tune=self.auto_tune,
+                                target_fps=self.target_fps)
+
+    def report_phase_times(self):
+        """輸出每個啟動階段的耗時"""
+        report = "，".join("{}：{:.2f} 秒".format(name, seconds) for name, seconds in self.phase_times.items())
+        print("SetupWindow.on_confirm:啟動耗時 {} \n ".format(report))
+        logging.info("啟動耗時 {}".format(report))
+
+    def on_config_updated(self, window_layout_str, positions):
+        """LocationManager 更新框框位置時，轉換為擷取影像座標後交給 DetectionManager"""
+        if self.roi_capture:
+            self.monitor_module.set_capture_region(self.config_path, self.window_layout_str)
+        self.detection_module.on_config_updated(window_layout_str, self.monitor_module.map_config_boxes(positions))
+
 class LoadingWindow(QDialog):
 
     def __init__(self, parent=None):
@@ -191,7 +461,13 @@ class SetupWindow(QWidget):
         print("SetupWindow.__init__:初始化設定視窗... \n")
         self.config_path = 'data/window_admin_settings.json' # 管理員資料的保存路徑
         self.window_settings_path = 'data/window_admin_settings.json'  # 更新配置文件路徑
-        self.vehicle_detect_model_path = 'yolov8x.pt'  # 模型路徑
+        self.vehicle_detect_model_path = None  # 模型路徑，None 表示依照佈局從 LAYOUT_DEFAULTS 選擇（auto_tune 時從 LAYOUT_PROFILES 量測選擇）
+        self.roi_capture = False # 是否只擷取網格範圍（原生解析度）
+        self.inference_mode = "mosaic" # 推論模式，多格佈局可改為 "tiles" 逐格批次推論
+        self.inference_backend = "torch" # 推論後端，CPU 可改為 "onnx" 使用 ONNX Runtime
+        self.backend_options = {} # 推論後端的設定，例如 {"num_threads": 4, "graph_optimization": "all"}
+        self.auto_tune = False # 啟動時量測延遲，選擇達到目標 FPS 的最大模型與輸入大小
+        self.target_fps = 10.0 # 自動調整的目標 FPS，與推論執行緒的最短間隔 0.1 秒一致
         self.line_edits = [] # 保存 QLineEdit 的列表
         self.window_config = {} # 保存視窗配置的字典
         self.loading_window = LoadingWindow() # 創建動畫視窗
@@ -234,13 +510,29 @@ class SetupWindow(QWidget):
         self.grid_layout.addWidget(self.tokens_group_box, 1, 0, 1, 2)  # 將 QGroupBox 加入 grid_layout
 
         self.monitor_combo_box = QComboBox(self)
-        self.monitor_combo_box.addItems(["主視窗", "副視窗"])
+        self.monitor_combo_box.addItems(["主視窗", "副視窗"] + MonitorManager.list_monitor_names()[2:]) # 第三個以後的螢幕
         self.grid_layout.addWidget(QLabel("選擇螢幕："), 2, 0)
         self.grid_layout.addWidget(self.monitor_combo_box, 2, 1)
 
+        self.roi_check_box = QCheckBox("只擷取網格範圍（原生解析度）", self)
+        self.roi_check_box.setChecked(self.roi_capture)
+        self.grid_layout.addWidget(self.roi_check_box, 3, 0, 1, 2)
+
+        # 自動調整：第一次啟動時量測延遲選擇模型與輸入大小，結果依照電腦與佈局快取在 data/autotune_cache.json
+        self.auto_tune_check_box = QCheckBox("自動選擇模型，目標 FPS：", self)
+        self.auto_tune_check_box.setChecked(self.auto_tune)
+        self.target_fps_spin_box = QDoubleSpinBox(self)
+        self.target_fps_spin_box.setRange(1.0, 60.0)
+        self.target_fps_spin_box.setDecimals(1)
+        self.target_fps_spin_box.setValue(self.target_fps)
+        self.target_fps_spin_box.setEnabled(self.auto_tune)
+        self.auto_tune_check_box.toggled.connect(self.target_fps_spin_box.setEnabled)
+        self.grid_layout.addWidget(self.auto_tune_check_box, 4, 0)
+        self.grid_layout.addWidget(self.target_fps_spin_box, 4, 1)
+
         confirm_button = QPushButton("確認", self)
         confirm_button.clicked.connect(self.on_confirm)
-        self.grid_layout.addWidget(confirm_button, 3, 0, 1, 2)
+        self.grid_layout.addWidget(confirm_button, 5, 0, 1, 2)
         
         self.setLayout(self.grid_layout)  # 設置 layout 為 grid_layout
 
@@ -305,6 +597,9 @@ class SetupWindow(QWidget):
             print("LoadingWindow.initUI:動畫視窗開啟中... \n")
             window_layout_str = f"{self.window_count_combo_box.currentText()}"
             monitor_choice = self.monitor_combo_box.currentText()
+            self.roi_capture = self.roi_check_box.isChecked()
+            self.auto_tune = self.auto_tune_check_box.isChecked()
+            self.target_fps = self.target_fps_spin_box.value()
             admin_data = {}
             for window_id, (admin_edit, token_edit) in enumerate(self.line_edits, start=1):
                 admin_data[str(window_id)] = {
@@ -319,6 +614,12 @@ class SetupWindow(QWidget):
                 "window_layout_str": window_layout_str,
                 "admin_data": admin_data,
                 "monitor_choice": monitor_choice,
+                "roi_capture": self.roi_capture,
+                "inference_mode": self.inference_mode,
+                "inference_backend": self.inference_backend,
+                "backend_options": self.backend_options,
+                "auto_tune": self.auto_tune,
+                "target_fps": self.target_fps,
             }
             self.worker_thread = WorkerThread(data)
             self.worker_thread.finished.connect(self.on_worker_finished)
@@ -354,7 +655,7 @@ class MainWindow(MyWindow.Ui_MainWindow):
         self.setupUi(mainWindow)
         print("Main.__init__:初始化主視窗... \n")
         self.window_settings_path = 'data/window_admin_settings.json'  # 更新配置文件路徑
-        self.vehicle_detect_model_path = 'yolov8l.pt'  # 模型路徑
+        self.vehicle_detect_model_path = None  # 模型路徑，由設定視窗回傳實際使用的模型
         self.window_settings_data = None # 保存設定視窗回傳的資料
         self.window_layout_str = None # 保存視窗佈局
         self.monitor_choice = None # 保存使用者選擇的螢幕
@@ -362,23 +663,62 @@ class MainWindow(MyWindow.Ui_MainWindow):
         self.monitor_module = None
         self.location_module = None
         self.detection_module = None
+        self.event_store_path = 'data/events.db' # 偵測事件資料庫路徑
+        self.event_store = None
+        self.pipelines_path = 'data/pipelines.json' # 其他螢幕的管線設定，每個螢幕一個子行程
+        self.pipeline_configs = []
+        self.notification_router = None # 依照螢幕名稱把通知交給各自的 NotificationManager
+        self.notificationThread = None # 通知執行緒，設定完成後啟動
         mainWindow.closeEvent = self.closeEvent # 覆寫關閉視窗事件
-        self.notificationQueue = queue.Queue() # 保存通知的佇列
+        # 保存通知的佇列，有上限，LINE 變慢或無法連線時丟棄最舊的通知，避免記憶體無限增加
+        self.notificationQueue = NotificationQueue(maxsize=64, policy="drop_oldest")
+        self.inference_thread = None # 擷取與推論的執行緒
+        self.pipeline_thread = None # 其他螢幕的管線執行緒
+        self.preview_items = {} # {螢幕名稱: QGraphicsPixmapItem}，其他螢幕的預覽並排在主螢幕右側
+        self.scheduler = FrameScheduler(active_fps=10.0, idle_fps=2.0) # 有車輛時 10 FPS，閒置時 2 FPS
+        self.display_interval = 0.1 # 預覽畫面最短更新間隔秒數，與推論速度無關
+        self.display_enabled = True # 視窗最小化時為 False，推論執行緒不送出預覽影像
+        self.display_size = None # 目前顯示影像的 (寬, 高)
+        self.metrics_server = MetricsHTTPServer(REGISTRY, port=9108) # 本機統計端點 http://127.0.0.1:9108/metrics
+        self.metrics_writer = MetricsFileWriter(REGISTRY, path="log/metrics.json", interval=10) # 每 10 秒寫出一次統計
+        self.profiler = SamplingProfiler(interval=0.005, output_dir="log") # 取樣分析器，只在使用者開啟時執行
+        self.profile_duration = 30 # 取樣分析的預設秒數
+        self.profile_timer = QTimer() # 時間到時在 GUI 執行緒停止取樣分析
+        self.profile_timer.setSingleShot(True)
+        self.profile_timer.timeout.connect(self.stop_profiler)
 
         # 初始化模組
         self.pixmap_item = QGraphicsPixmapItem() # 用於顯示圖片的 QGraphicsPixmapItem
         self.mainWindow = mainWindow
         self.scene.addItem(self.pixmap_item)
+        self.pixmap_item.setTransformationMode(Qt.FastTransformation) # 由 QGraphicsView 縮放，使用最快的取樣
+        self.graphicsView.resizeEvent = self.on_view_resized
         self.setupWindow = self.createSetupWindow() # 創建設定視窗
         self.initButtons() # 初始化按鈕和連接
+        self.initMetricsPanel() # 初始化效能統計面板
 
     def initButtons(self): # 初始化按鈕和連接
         self.run_btn.clicked.connect(self.start_processing)
         self.stop_btn.clicked.connect(self.stop_processing)
         self.action_system_info.triggered.connect(self.show_system_info)
         self.action_cuda_info.triggered.connect(self.show_cuda_info)
+        self.action_profiler.triggered.connect(self.toggle_profiler)
         self.stop_btn.setEnabled(False)
 
+    def initMetricsPanel(self):
+        """在主視窗右側建立效能統計面板，顯示各階段耗時、計數與佇列深度"""
+        self.metrics_text = QPlainTextEdit()
+        self.metrics_text.setReadOnly(True)
+        self.metrics_text.setFont(QFont("Consolas", 9))
+        self.metrics_dock = QDockWidget("效能統計", self.mainWindow)
+        self.metrics_dock.setWidget(self.metrics_text)
+        self.mainWindow.addDockWidget(Qt.RightDockWidgetArea, self.metrics_dock)
+        # 通知佇列與排程的統計在匯出時才讀取
+        REGISTRY.gauge("notification_queue_depth", "通知佇列中等待的通知數", callback=lambda: self.notificationQueue.stats()["depth"])
+        REGISTRY.gauge("notification_queue_dropped", "通知佇列已滿而丟棄的通知數", callback=lambda: self.notificationQueue.stats()["dropped"])
+        REGISTRY.gauge("inference_fps", "推論的實際 FPS", callback=lambda: self.scheduler.achieved_fps())
+        REGISTRY.gauge("inference_target_fps", "推論的目標 FPS", callback=lambda: self.scheduler.target_fps())
+
     def createSetupWindow(self): # 創建設定窗口
         setupWindow = SetupWindow()
         setupWindow.setup_completed.connect(self.handle_setup_data)
@@ -393,6 +733,7 @@ class MainWindow(MyWindow.Ui_MainWindow):
         self.setupWindow.close()
         print("MainWindow.initUI:主視窗開啟！ \n")
         self.mainWindow.show()
+        self.mainWindow.windowHandle().windowStateChanged.connect(self.on_window_state_changed)
         
     def handle_setup_data(self, setupData):
         """
@@ -407,9 +748,28 @@ class MainWindow(MyWindow.Ui_MainWindow):
             self.location_module = setupData["location_module"]
             self.detection_module = setupData["detection_module"]
             self.monitor_choice = setupData["monitor_choice"]
+            self.vehicle_detect_model_path = self.detection_module.profile["weights"] # 實際使用的模型
+            self.event_store = EventStore(self.event_store_path, layout=self.window_layout_str) # 在背景批次寫入偵測事件
+            self.detection_module.event_store = self.event_store
+            
+            self.pipeline_configs = []
+            for pipeline_config in load_pipeline_configs(self.pipelines_path):
+                if pipeline_config["monitor_name"] == self.monitor_choice:
+                    logging.warning("管線設定的螢幕 {} 已由主視窗監看，略過".format(self.monitor_choice))
+                    continue
+                self.pipeline_configs.append(pipeline_config)
+            self.notification_router = NotificationRouter(self.communication_module, {
+                pipeline_config["monitor_name"]: NotificationManager(config_path=pipeline_config["config_path"],
+                                                                     window_layout_str=pipeline_config["window_layout_str"])
+                for pipeline_config in self.pipeline_configs})
             
-            self.notificationThread = NotificationThread(self.notificationQueue, self.communication_module)
+            self.notificationThread = NotificationThread(self.notificationQueue, self.notification_router)
             self.notificationThread.start() # 啟動通知執行緒
+            self.queue_status_timer = QTimer()
+            self.queue_status_timer.timeout.connect(self.update_queue_status)
+            self.queue_status_timer.start(1000) # 每秒更新一次通知佇列狀態與效能統計
+            self.metrics_server.start()
+            self.metrics_writer.start()
             print("MainWindow.handle_setup_data:通知執行緒啟動！ \n")
             self.initUI()
             
@@ -419,48 +779,58 @@ class MainWindow(MyWindow.Ui_MainWindow):
             return None
 
     def start_processing(self):
-        # 開始影像處理流程
+        # 開始影像處理流程，擷取與推論都在推論執行緒中進行，GUI 執行緒只負責顯示
         self.run_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.process_frame)
-        self.timer.start(100) # 每 100 毫秒處理一次影像 = 10 FPS
+        self.inference_thread = InferenceThread(self.monitor_module, self.detection_module, self.notificationQueue,
+                                                scheduler=self.scheduler, display_interval=self.display_interval)
+        self.inference_thread.display_enabled = self.display_enabled
+        self.inference_thread.frame_ready.connect(self.on_frame_ready)
+        self.inference_thread.error_occurred.connect(self.show_alert_dialog)
+        self.inference_thread.start()
+        if self.pipeline_configs:
+            # 其他螢幕各自在子行程中擷取與偵測，通知與預覽回到主視窗
+            self.pipeline_thread = PipelineThread(self.pipeline_configs, self.notificationQueue,
+                                                  event_store_path=self.event_store_path, display_interval=self.display_interval)
+            self.pipeline_thread.display_enabled = self.display_enabled
+            self.pipeline_thread.frame_ready.connect(self.on_pipeline_frame_ready)
+            self.pipeline_thread.error_occurred.connect(self.show_alert_dialog)
+            self.pipeline_thread.start()
 
-    def process_frame(self):
-        """處理影像，並交給updatePixmap顯示偵測結果
-
-        Returns:
-            _type_: _description_
-        """
+    def on_frame_ready(self, anno_frame, results):
+        """推論執行緒完成一張影像時，交給updatePixmap顯示偵測結果"""
         try:
-            print("----------------處理影像中...----------------")
-            frame = self.monitor_module.temp_get_frame() # 從螢幕擷取影像
-            results, anno_frame = self.detection_module.detect(frame) # 偵測物體，並回傳落在哪個區塊
-            if results is not None:
-                for result in results:
-                    frame_id, vehicle = result
-                    notification_data={
-                        "window_id": frame_id,
-                        "vehicle": vehicle,
-                        "imgae": frame,
-                        "massage": "發現車輛"
-                    }
-                    logging.info(f"偵測到車輛，落於：{frame_id}號框, 車輛 ID：{vehicle.vehicle_id}, 車輛類別：{vehicle.vehicle_type}, 車輛位置：{vehicle.position}")
-                    self.notificationQueue.put(notification_data) # 將通知放入佇列
-            else:
-                print("沒有偵測到車輛")
             self.updatePixmap(anno_img=anno_frame) # 顯示偵測結果
+        finally:
+            if self.inference_thread is not None:
+                self.inference_thread.display_done()
+
+    def on_pipeline_frame_ready(self, monitor_name, anno_frame):
+        """其他螢幕的管線完成一張影像時，更新該螢幕的預覽"""
+        try:
+            if not self.mainWindow.isMinimized() and self.mainWindow.isVisible():
+                with REGISTRY.stage("display").time():
+                    self.show_preview_image(monitor_name, anno_frame)
         except Exception as e:
-            logging.error("'process_frame' 方法發生錯誤：{}".format(e))
-            self.show_alert_dialog(f"process_frame 錯誤發生({e})!")
-            return None
-        
+            logging.error("'on_pipeline_frame_ready' 方法發生錯誤：{}".format(e))
+        finally:
+            if self.pipeline_thread is not None:
+                self.pipeline_thread.display_done(monitor_name)
+
     def stop_processing(self):
         # 停止影像處理流程
         self.run_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        if self.inference_thread is not None:
+            self.inference_thread.stop()
+            self.inference_thread = None
+        if self.pipeline_thread is not None:
+            self.pipeline_thread.stop()
+            self.pipeline_thread = None
         self.pixmap_item.setPixmap(QPixmap()) #清空畫面
-        self.timer.stop()
+        for item in self.preview_items.values():
+            self.scene.removeItem(item)
+        self.preview_items = {}
 
     def show_system_info(self):
             try:
@@ -497,24 +867,140 @@ class MainWindow(MyWindow.Ui_MainWindow):
             logging.error("'show_cuda_info' 方法發生錯誤：{}".format(e))
             self.show_alert_dialog(f"show_cuda_info 錯誤發生({e})!")
 
+    def toggle_profiler(self, checked):
+        """開始或提前停止取樣分析，開始時詢問分析秒數"""
+        if not checked:
+            self.stop_profiler()
+            return
+        duration, ok = QInputDialog.getInt(self.mainWindow, "取樣分析", "分析秒數：", self.profile_duration, 1, 600)
+        if not ok or not self.profiler.start(duration=duration):
+            self.action_profiler.setChecked(self.profiler.running)
+            return
+        self.profile_duration = duration
+        self.profile_timer.start(duration * 1000)
+        self.statusbar.showMessage("取樣分析中，{} 秒後自動停止...".format(duration))
+
+    def stop_profiler(self):
+        """停止取樣分析，顯示最耗時的函式與輸出檔案"""
+        self.profile_timer.stop()
+        self.action_profiler.setChecked(False)
+        try:
+            path = self.profiler.stop()
+            if path is None:
+                return
+            top = "\n".join("{:>6}  {}".format(count, function) for function, count in self.profiler.summary())
+            QMessageBox.information(self.mainWindow, "取樣分析",
+                                    "共 {} 次取樣，已寫出 {}\n\n最常出現的函式：\n{}".format(self.profiler.samples, path, top), QMessageBox.Ok)
+        except Exception as e:
+            logging.error("'stop_profiler' 方法發生錯誤：{}".format(e))
+            self.show_alert_dialog(f"stop_profiler 錯誤發生({e})!")
+
     def updatePixmap(self,anno_img):
+        """直接以 BGR 緩衝區建立 QImage（不做縮放與色彩轉換），縮放交給 QGraphicsView；
+        視窗最小化或隱藏時不繪製
+        """
         try:
-            scale = self.graphicsView.height() / anno_img.shape[0]  # 計算縮放比例
-            resized_h = int(anno_img.shape[1] * scale)
-            resized_w = int(anno_img.shape[0] * scale)
-            resized_img = cv2.resize(anno_img, (resized_h, resized_w), interpolation=cv2.INTER_NEAREST)
-            rgb_frame = cv2.cvtColor(resized_img, cv2.COLOR_BGR2RGB)  # 將圖片轉換為 RGB 格式
-            h, w, ch = rgb_frame.shape
-            bytesPerLine = ch * w
-            qimage = QtGui.QImage(rgb_frame.data, w, h, bytesPerLine, QtGui.QImage.Format_RGB888)
-            pixmap = QtGui.QPixmap.fromImage(qimage)
-            self.pixmap_item.setPixmap(pixmap)
-            print("更新畫面完成！")
+            if self.mainWindow.isMinimized() or not self.mainWindow.isVisible():
+                return
+            with REGISTRY.stage("display").time():
+                self.show_image(anno_img)
         except Exception as e:
             print(e)
             self.show_alert_dialog(f"updatePixmap 錯誤發生({e})!")
             logging.error("'updatePixmap' 方法發生錯誤：{}".format(e))
 
+    def show_image(self, anno_img):
+        """將 BGR 影像交給 pixmap_item 顯示"""
+        pixmap = self.to_pixmap(anno_img)
+        self.pixmap_item.setPixmap(pixmap)
+        if self.display_size != (pixmap.width(), pixmap.height()): # 影像大小改變時才重新計算縮放
+            self.display_size = (pixmap.width(), pixmap.height())
+            self.layout_previews()
+
+    def show_preview_image(self, monitor_name, anno_img):
+        """將其他螢幕的 BGR 影像交給該螢幕的 QGraphicsPixmapItem 顯示"""
+        item = self.preview_items.get(monitor_name)
+        if item is None:
+            item = self.preview_items[monitor_name] = QGraphicsPixmapItem()
+            item.setTransformationMode(Qt.FastTransformation)
+            self.scene.addItem(item)
+        pixmap = self.to_pixmap(anno_img)
+        resized = item.pixmap().size() != pixmap.size()
+        item.setPixmap(pixmap)
+        if resized:
+            self.layout_previews()
+
+    def layout_previews(self):
+        """其他螢幕的預覽縮放到與主螢幕相同高度，依序排在右側，再重新縮放整個畫面"""
+        x = self.pixmap_item.boundingRect().width()
+        height = self.pixmap_item.boundingRect().height()
+        for item in self.preview_items.values():
+            item_height = item.boundingRect().height()
+            if item_height <= 0:
+                continue
+            scale = height / item_height if height > 0 else 1.0
+            item.setScale(scale)
+            item.setPos(x, 0)
+            x += item.boundingRect().width() * scale
+        self.fit_view()
+
+    def to_pixmap(self, anno_img):
+        """直接以 BGR 緩衝區建立 QPixmap"""
+        if not anno_img.flags["C_CONTIGUOUS"]:
+            anno_img = np.ascontiguousarray(anno_img)
+        h, w, ch = anno_img.shape
+        bytesPerLine = anno_img.strides[0]
+        if hasattr(QtGui.QImage, "Format_BGR888"): # Qt 5.14 以上支援 BGR888，不需要轉換色彩
+            qimage = QtGui.QImage(anno_img.data, w, h, bytesPerLine, QtGui.QImage.Format_BGR888)
+        else:
+            qimage = QtGui.QImage(anno_img.data, w, h, bytesPerLine, QtGui.QImage.Format_RGB888).rgbSwapped()
+        return QtGui.QPixmap.fromImage(qimage) # 在 anno_img 仍存在時複製到 pixmap
+
+    def fit_view(self):
+        """讓 QGraphicsView 依照視窗大小縮放影像（主螢幕與其他螢幕的預覽）"""
+        rect = self.scene.itemsBoundingRect()
+        if not rect.isEmpty():
+            self.scene.setSceneRect(rect)
+            self.graphicsView.fitInView(rect, Qt.KeepAspectRatio)
+
+    def on_view_resized(self, event):
+        QGraphicsView.resizeEvent(self.graphicsView, event)
+        self.fit_view()
+
+    def on_window_state_changed(self, state):
+        """視窗最小化時停止送出預覽影像，恢復時重新縮放"""
+        self.display_enabled = not (state & Qt.WindowMinimized)
+        if self.inference_thread is not None:
+            self.inference_thread.display_enabled = self.display_enabled
+        if self.pipeline_thread is not None:
+            self.pipeline_thread.display_enabled = self.display_enabled
+        if self.display_enabled:
+            self.fit_view()
+
+    def update_queue_status(self):
+        """在狀態列顯示推論的實際與目標 FPS，以及通知佇列的深度、等待時間與統計"""
+        stats = self.notificationQueue.stats()
+        message = ("通知佇列：{depth}/{maxsize}，最舊等待 {oldest_age:.1f} 秒｜排入 {enqueued}，丟棄 {dropped}，"
+                   "已發送 {sent}，失敗 {failed}".format(**stats))
+        if self.inference_thread is not None:
+            message = ("推論（{mode}）：{achieved_fps:.1f}/{target_fps:.1f} FPS，處理 {latency_ms:.0f} ms，"
+                       "擷取到完成 {end_to_end_ms:.0f} ms｜".format(**self.scheduler.stats())) + message
+        self.statusbar.showMessage(message)
+        self.update_metrics_panel()
+
+    def update_metrics_panel(self):
+        """在效能統計面板顯示各階段耗時的百分位數與所有計數"""
+        lines = ["{:<14}{:>8}{:>9}{:>9}{:>9}".format("階段", "次數", "p50 ms", "p90 ms", "p99 ms")]
+        others = []
+        for name, value in REGISTRY.snapshot()["metrics"].items():
+            if isinstance(value, dict):
+                stage = name.split('stage="')[-1].rstrip('"}')
+                lines.append("{:<16}{:>8}{:>9.1f}{:>9.1f}{:>9.1f}".format(stage, value["count"], value["p50"] * 1000,
+                                                                       value["p90"] * 1000, value["p99"] * 1000))
+            else:
+                others.append("{} = {:g}".format(name, value))
+        self.metrics_text.setPlainText("\n".join(lines + [""] + others))
+
     def show_alert_dialog(self, message):
         QMessageBox.warning(self.mainWindow, "錯誤", message, QMessageBox.Ok)
 
@@ -523,6 +1009,19 @@ class MainWindow(MyWindow.Ui_MainWindow):
         # 例如 self.someBackgroundProcess.terminate() 或 self.someThread.quit()
         result = QtWidgets.QMessageBox.question(self.mainWindow, "關閉視窗", "確定要關閉視窗嗎?", QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
         if(result == QtWidgets.QMessageBox.Yes):
+            if self.inference_thread is not None:
+                self.inference_thread.stop()
+            if self.pipeline_thread is not None:
+                self.pipeline_thread.stop() # 停止其他螢幕的子行程
+            if self.notificationThread is not None:
+                self.notificationThread.stop() # 推論停止後發送剩下的通知並關閉所有 NotificationManager
+            self.metrics_server.stop()
+            self.metrics_writer.stop()
+            self.profiler.stop()
+            if self.event_store is not None:
+                if self.detection_module is not None:
+                    self.detection_module.record_live_tracks() # 仍在畫面中的車輛記錄最後出現時間
+                self.event_store.close() # 推論執行緒停止後寫完剩下的事件
             event.accept()
             # 關閉所有打開的子視窗
             for window in QApplication.topLevelWidgets():
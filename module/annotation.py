@@ -0,0 +1,60 @@
+# annotation.py
+# 用途：延遲產生的標註影像，偵測時只保存原始影像與偵測結果，需要顯示時才繪製一次
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import threading
+import cv2
+from module.metrics import REGISTRY
+
+
+class AnnotatedFrame:
+    """一張影像的標註結果，呼叫 render() 時才繪製車輛與框框，繪製結果會被快取，
+    同一張影像不論顯示幾次都只繪製一次；沒有人顯示時（無畫面執行、視窗最小化、批次測試）完全不繪製。
+    原始影像不會被修改，render() 回傳的是另一份影像
+    """
+    def __init__(self, frame, result=None, boxes:list=None, overlay=None):
+        """
+        Args:
+            frame (np.ndarray): 原始 BGR 影像
+            result (ultralytics.engine.results.Results, optional): 整張影像推論的結果，以 plot() 繪製
+            boxes (list, optional): [(車輛 ID, 車輛類別, 車輛位置), ...]，批次推論時自行繪製的車輛
+            overlay (GridOverlay, optional): 框框與 ID 標籤的覆蓋層
+        """
+        self.frame = frame
+        self.result = result
+        self.boxes = boxes or []
+        self.overlay = overlay
+        self.image = None # 快取的標註影像
+        self.lock = threading.Lock() # 推論執行緒與顯示端可能同時呼叫 render()
+
+    @property
+    def rendered(self) -> bool:
+        """是否已經繪製過"""
+        return self.image is not None
+
+    def render(self):
+        """繪製標註影像，只在第一次呼叫時繪製
+
+        Returns:
+            np.ndarray: 標註後的 BGR 影像
+        """
+        with self.lock:
+            if self.image is None:
+                self.render_image()
+            return self.image
+
+    def render_image(self) -> None:
+        """實際繪製標註影像（呼叫時需持有鎖）"""
+        with REGISTRY.stage("annotation").time():
+            # plot() 會複製原始影像再繪製
+            image = self.result.plot() if self.result is not None else self.frame.copy()
+            for vehicle_id, vehicle_type, position in self.boxes:
+                cv2.rectangle(image, position[:2], position[2:], (0, 0, 255), 2)
+                cv2.putText(image, "id:{} {}".format(vehicle_id, vehicle_type), (position[0], max(position[1] - 5, 10)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            if self.overlay is not None:
+                self.overlay.apply(image) # 繪製所有框框，直接合成預先繪製好的覆蓋層
+            self.image = image
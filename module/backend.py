@@ -0,0 +1,196 @@
+# backend.py
+# 用途：車輛偵測模型的推論後端，DetectionManager 透過後端取得模型，追蹤器與框框判斷的邏輯不受後端影響
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import hashlib
+import inspect
+import shutil
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('backend', 'InferenceBackend.log')
+
+
+class InferenceBackend:
+    """推論後端的基底類別，load() 回傳具有 track() 的 ultralytics 模型，
+    DetectionManager 只使用 track()、predict() 與 predictor，因此任何後端都能共用同一套追蹤器與框框邏輯
+    """
+    name = "base"
+
+    def __init__(self, weights_path:str):
+        self.weights_path = weights_path
+        self.model = None
+
+    def load(self):
+        """載入模型，重複呼叫時回傳同一個模型"""
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        """後端的說明文字，用於日誌與狀態顯示"""
+        return "{}（{}）".format(self.name, os.path.basename(self.weights_path))
+
+
+class TorchBackend(InferenceBackend):
+    """原本的 PyTorch 推論，直接使用 .pt 權重"""
+    name = "torch"
+
+    def __init__(self, weights_path:str, num_threads:int=None):
+        """
+        Args:
+            weights_path (str): .pt 權重路徑
+            num_threads (int, optional): torch 的運算執行緒數（torch.set_num_threads，整個行程共用），None 表示由 torch 決定
+        """
+        super().__init__(weights_path)
+        self.num_threads = num_threads
+
+    def load(self):
+        if self.model is None:
+            from ultralytics import YOLO # 延遲匯入，只有載入模型時才載入 torch
+            if self.num_threads:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            self.model = YOLO(self.weights_path)
+        return self.model
+
+    def describe(self) -> str:
+        return "{}（{}，threads={}）".format(self.name, os.path.basename(self.weights_path), self.num_threads or "auto")
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime CPU 推論。
+    第一次使用時以 ultralytics 將 .pt 權重匯出為 ONNX，依照權重雜湊值快取在 cache_dir，之後直接載入快取；
+    ultralytics 建立的 InferenceSession 沒有執行緒與圖形最佳化設定，在預測開始時換成依照設定建立的 session
+    """
+    name = "onnx"
+    GRAPH_OPTIMIZATIONS = ("disable", "basic", "extended", "all")
+
+    def __init__(self, weights_path:str, cache_dir:str="weights/cache", imgsz:int=640, num_threads:int=None,
+                 graph_optimization:str="all"):
+        """
+        Args:
+            weights_path (str): .pt 權重路徑，也可以直接指定 .onnx 檔案
+            cache_dir (str): 匯出模型的快取目錄
+            imgsz (int): 匯出時的輸入大小，匯出為動態大小，批次推論時也能使用其他大小
+            num_threads (int, optional): ONNX Runtime 的運算執行緒數，None 表示由 ONNX Runtime 決定
+            graph_optimization (str): "disable"、"basic"、"extended" 或 "all"
+        """
+        super().__init__(weights_path)
+        if graph_optimization not in self.GRAPH_OPTIMIZATIONS:
+            raise ValueError("未知的圖形最佳化等級：{}".format(graph_optimization))
+        self.cache_dir = cache_dir
+        self.imgsz = imgsz
+        self.num_threads = num_threads
+        self.graph_optimization = graph_optimization
+        self.onnx_path = None
+        self.session = None # 依照設定建立的 InferenceSession
+
+    @staticmethod
+    def file_hash(path:str, chunk_size:int=1 << 20) -> str:
+        """計算權重檔案的 SHA-256，權重改變時會重新匯出"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as weights_file:
+            for chunk in iter(lambda: weights_file.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def resolve_weights(self) -> str:
+        """取得本機的權重路徑，檔案不存在時與 YOLO() 相同，先下載官方權重（例如 yolov8l.pt）"""
+        if os.path.exists(self.weights_path):
+            return self.weights_path
+        from ultralytics.utils.downloads import attempt_download_asset
+        return str(attempt_download_asset(self.weights_path))
+
+    def cached_path(self) -> str:
+        """匯出模型的快取路徑，以權重名稱、雜湊值與輸入大小命名"""
+        stem = os.path.splitext(os.path.basename(self.weights_path))[0]
+        return os.path.join(self.cache_dir, "{}-{}-{}.onnx".format(stem, self.file_hash(self.weights_path)[:16], self.imgsz))
+
+    def export(self) -> str:
+        """取得 ONNX 模型路徑，快取中沒有時才匯出
+
+        Returns:
+            str: .onnx 檔案路徑
+        """
+        if self.weights_path.endswith(".onnx"):
+            return self.weights_path
+        self.weights_path = self.resolve_weights() # 計算雜湊值前權重必須存在
+        onnx_path = self.cached_path()
+        if os.path.exists(onnx_path):
+            logging.info("使用快取的 ONNX 模型：{}".format(onnx_path))
+            return onnx_path
+        from ultralytics import YOLO
+        logging.info("匯出 ONNX 模型：{} -> {}".format(self.weights_path, onnx_path))
+        exported_path = YOLO(self.weights_path).export(format="onnx", imgsz=self.imgsz, dynamic=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = onnx_path + ".tmp"
+        shutil.move(exported_path, temp_path)
+        os.replace(temp_path, onnx_path) # 完整寫入後才出現在快取中，避免其他行程讀到一半的檔案
+        return onnx_path
+
+    def session_options(self):
+        """依照設定建立 ONNX Runtime 的 SessionOptions"""
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = {
+            "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[self.graph_optimization]
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        return options
+
+    def configure_session(self, predictor) -> None:
+        """on_predict_start 回呼：把 ultralytics 建立的 session 換成依照設定建立的 session"""
+        backend_model = getattr(predictor, "model", None)
+        if backend_model is None or not hasattr(backend_model, "session") or backend_model.session is self.session:
+            return
+        import onnxruntime
+        if self.session is None:
+            self.session = onnxruntime.InferenceSession(self.onnx_path, sess_options=self.session_options(),
+                                                        providers=["CPUExecutionProvider"])
+        backend_model.session = self.session
+
+    def load(self):
+        if self.model is None:
+            from ultralytics import YOLO
+            self.onnx_path = self.export()
+            self.model = YOLO(self.onnx_path, task="detect")
+            self.model.add_callback("on_predict_start", self.configure_session)
+        return self.model
+
+    def describe(self) -> str:
+        return "{}（{}，threads={}，optimization={}）".format(self.name, os.path.basename(self.weights_path),
+                                                            self.num_threads or "auto", self.graph_optimization)
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name:str, weights_path:str, **options) -> InferenceBackend:
+    """依照名稱建立推論後端
+
+    Args:
+        name (str): "torch" 或 "onnx"
+        weights_path (str): 權重路徑
+        **options: 後端的設定，例如 OnnxBackend 的 num_threads、graph_optimization
+
+    Returns:
+        InferenceBackend: 推論後端
+    """
+    if name not in BACKENDS:
+        raise ValueError("未知的推論後端：{}".format(name))
+    parameters = inspect.signature(BACKENDS[name].__init__).parameters
+    unsupported = [option for option in options if option not in parameters or option == "weights_path"]
+    if unsupported:
+        raise ValueError("推論後端 {} 不支援的設定：{}".format(name, ", ".join(unsupported)))
+    return BACKENDS[name](weights_path, **options)
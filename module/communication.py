@@ -5,32 +5,95 @@ import os
 # 將目錄切換至根目錄
 sys.path.append(os.path.join(os.path.dirname(__file__), '..')) 
 
+import time
+import threading
+import mimetypes
+from collections import deque, OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import json
 import cv2
 from io import BytesIO
 from utils.log import setup_logger
+from module.metrics import REGISTRY
 
 # 設置日誌處理器，支持指定編碼
 logging = setup_logger('communication', 'CommunicationManager.log')
 
 
+LINE_NOTIFY_URL = "https://notify-api.line.me/api/notify" # LINE API網址
+
+
 class NotificationManager:
-    def __init__(self, config_path:str, window_layout_str:str):
+    def __init__(self, config_path:str, window_layout_str:str, api_url:str=LINE_NOTIFY_URL, max_workers:int=4,
+                 connect_timeout:float=3.05, read_timeout:float=10, max_retries:int=3, backoff_factor:float=0.5,
+                 snapshot_encoder=None):
         self.window_settings = json.load(open(config_path, "r"))
         self.window_layout_str = window_layout_str
+        self.api_url = api_url # 可改為本機的替代伺服器做測試
+        self.timeout = (connect_timeout, read_timeout) # (連線, 讀取) 逾時秒數
+        # 共用的 HTTP session，保持連線 (keep-alive)，並對 429/5xx 以退避重試，遵守 Retry-After
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["POST"]), respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # 有上限的發送執行緒池，送出中的通知超過上限時 submit_notification 會等待
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="NotificationSender")
+        self.inflight = threading.BoundedSemaphore(max_workers * 2)
+        self.rate_limit_lock = threading.Lock()
+        self.rate_limited_until = {} # {token: time.monotonic()}，LINE 回報額度用完時暫停發送到重置時間
+        # 通知圖片的編碼，同一張影像的縮圖與編碼結果共用，可傳入 SnapshotEncoder 調整格式、品質與裁切模式
+        self.snapshot_encoder = snapshot_encoder if snapshot_encoder is not None else SnapshotEncoder()
+
+    def get_manager_info(self, window_id:str) -> dict:
+        """從配置中獲取特定視窗的管理員資料"""
+        return self.window_settings.get(self.window_layout_str, {}).get(window_id, {}).get("manager", {})
+
+    def submit_notification(self, window_id:str, message:str, image=None, vehicle=None, vehicles=None, frame_key=None):
+        """將通知交給執行緒池發送，送出中的通知已達上限時會等待
+
+        Returns:
+            concurrent.futures.Future: 發送結果
+        """
+        self.inflight.acquire()
+        try:
+            future = self.executor.submit(self.send_notification_to_manager, window_id, message, image, vehicle, vehicles, frame_key)
+        except Exception:
+            self.inflight.release()
+            raise
+        future.add_done_callback(lambda _: self.inflight.release())
+        return future
+
+    def close(self, wait:bool=True) -> None:
+        """停止執行緒池並關閉 HTTP session"""
+        self.executor.shutdown(wait=wait)
+        self.session.close()
 
-    def send_notification_to_manager(self, window_id:str, message:str, image=None, vehicle=None) -> None:
+    def send_notification_to_manager(self, window_id:str, message:str, image=None, vehicle=None, vehicles=None, frame_key=None) -> bool:
         """
-        根據視窗ID發送通知。
+        根據視窗ID發送通知。vehicles 有多台車輛時，所有車輛會畫在同一張圖上。
+        frame_key 為影像的識別碼（例如影像序號），同一張影像的通知會共用縮圖與編碼結果。
         """
+        vehicles = list(vehicles) if vehicles else ([vehicle] if vehicle is not None else [])
+        with REGISTRY.stage("notification").time():
+            success = self.send_notification(window_id, message, image, vehicles, frame_key)
+        REGISTRY.counter("notifications_total", "發送的通知數", result="sent" if success else "failed").inc()
+        return success
+
+    def send_notification(self, window_id:str, message:str, image, vehicles:list, frame_key=None) -> bool:
+        """send_notification_to_manager 的實際發送流程"""
         try:
-            #如果有車輛資訊和影像，則畫出車輛位置
-            if vehicle is not None and image is not None: 
+            #如果有影像，則編碼成通知圖片，有車輛資訊時畫出車輛位置
+            if image is not None and not isinstance(image, BytesIO):
                 # 畫出車輛位置，在這邊才畫的原因是為了不浪費記憶體空間
-                image = self.draw_rectangle(image, vehicle) 
+                with REGISTRY.stage("snapshot_encode").time():
+                    image = self.snapshot_encoder.encode(image, vehicles, frame_key)
             # 從配置中獲取特定視窗的管理員資料
-            manager_info = self.window_settings.get(self.window_layout_str, {}).get(window_id, {}).get("manager", {})
+            manager_info = self.get_manager_info(window_id)
 
             # 根據管理員資料發送通知
             contact_method = manager_info.get('contact_method')
@@ -38,12 +101,13 @@ class NotificationManager:
             # 如果有LINE API token，則發送通知
             if contact_method == 'LINE' and manager_info.get('token'):
                 response=self.send_line_notification(manager_info['token'], message, image)
-                if response.status_code == 200:
-                    logging.info("已發送通知給 {}，訊息內容：{}".format(manager_info['manager_name'], response.text))
-                else:
-                    logging.error("發送通知給 {} 失敗，錯誤資訊 {}".format(manager_info['manager_name'], message))
+                if response is not None and response.status_code == 200:
+                    logging.info("已發送通知給 {}，訊息內容：{}".format(manager_info.get('manager_name'), response.text))
+                    return True
+                logging.error("發送通知給 {} 失敗，錯誤資訊 {}".format(manager_info.get('manager_name'), message))
             else:
-                logging.error("沒有找到 {} 的LINE API token，無法發送通知".format(manager_info['manager_name']))
+                logging.error("沒有找到 {} 的LINE API token，無法發送通知".format(manager_info.get('manager_name')))
+            return False
 
         # 如果發生錯誤，則記錄錯誤訊息
         except Exception as e:
@@ -54,24 +118,55 @@ class NotificationManager:
 
     def send_line_notification(self, token:str, message:str ,image=None) -> requests.models.Response:
         """
-        用途：使用LINE API發送通知 \n
+        用途：使用LINE API發送通知，使用共用的 session 與逾時設定，
+        LINE 回報額度用完 (X-RateLimit-Remaining 為 0) 時，同一個 token 會暫停到重置時間 \n
         參數：
             token(str): LINE API token
             message(str): 要發送的訊息
-            image(cv2): 要發送的圖片 \n
+            image(BytesIO): 要發送的圖片 \n
         返回：
-            response(requests.models.Response): LINE API的回應
+            response(requests.models.Response): LINE API的回應，發生錯誤時為 None
         """
-        line_api_url = "https://notify-api.line.me/api/notify" # LINE API網址
         headers = {"Authorization": f"Bearer {token}"} # LINE API標頭，使用token驗證
         data = {"message":  message}
-        files = { 'imageFile': image } # 要發送的圖片檔案
+        # 以 bytes 傳送圖片，重試時可以重複使用同一份內容
+        files = None
+        if isinstance(image, BytesIO):
+            file_name = getattr(image, "name", "snapshot.png")
+            files = {'imageFile': (file_name, image.getvalue(), mimetypes.guess_type(file_name)[0] or 'application/octet-stream')} # 要發送的圖片檔案
         try:
-            response=requests.post(line_api_url, headers = headers, data = data, files = files) # 發送請求
+            self.wait_rate_limit(token)
+            response=self.session.post(self.api_url, headers = headers, data = data, files = files, timeout = self.timeout) # 發送請求
+            self.update_rate_limit(token, response)
         except Exception as e:
             logging.error("'send_line_notification' 方法發生錯誤：{}".format(e))
+            return None
         return response
 
+    def wait_rate_limit(self, token:str) -> None:
+        """如果該 token 的額度已經用完，等待到重置時間"""
+        with self.rate_limit_lock:
+            until = self.rate_limited_until.get(token, 0)
+        remaining = until - time.monotonic()
+        if remaining > 0:
+            logging.warning("LINE API 額度已用完，等待 {:.1f} 秒後再發送".format(remaining))
+            time.sleep(remaining)
+
+    def update_rate_limit(self, token:str, response:requests.models.Response) -> None:
+        """依照 LINE API 回應的 X-RateLimit 標頭記錄額度重置時間"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            if int(remaining) <= 0:
+                # X-RateLimit-Reset 為 UTC epoch 秒數，換算成 monotonic 時間
+                wait_seconds = max(0.0, float(reset) - time.time())
+                with self.rate_limit_lock:
+                    self.rate_limited_until[token] = time.monotonic() + wait_seconds
+        except ValueError:
+            return
+
     def draw_rectangle(self,frame,vehicle):
         """畫出車輛位置
 
@@ -79,14 +174,286 @@ class NotificationManager:
             frame (cv2): _description_
             vehicle (Vehicle): _description_
         """
-        result_frame=frame.copy()
+        return self.draw_rectangles(frame, [vehicle])
+
+    def draw_rectangles(self, frame, vehicles:list, frame_key=None):
+        """在同一張圖上畫出多台車輛的位置，只複製與編碼一次
+
+        Args:
+            frame (cv2): 原始影像
+            vehicles (list): Vehicle 列表
+            frame_key (optional): 影像的識別碼，同一張影像共用縮圖
+
+        Returns:
+            BytesIO: 編碼後的圖片
+        """
+        return self.snapshot_encoder.encode(frame, vehicles, frame_key)
+
+
+class SnapshotEncoder:
+    """通知圖片的編碼。
+    "full" 模式：每張影像只縮小一次（以 frame_key 快取），不畫框或沒有車輛時連編碼結果也共用；
+    "crop" 模式：直接從原始解析度影像裁切車輛周圍的區域，圖片更小也更清楚。
+    支援 jpg / webp / png，jpg 與 webp 可調整 quality（LINE Notify 只接受 jpg 與 png）
+    """
+    ENCODE_PARAMS = {
+        "jpg": lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+        "webp": lambda quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+        "png": lambda quality: [cv2.IMWRITE_PNG_COMPRESSION, 1], # png 不支援 quality，使用最快的壓縮等級
+    }
+
+    def __init__(self, image_format:str="jpg", quality:int=85, mode:str="full", output_size:tuple=(640, 360),
+                 crop_margin:float=0.5, crop_max_size:int=640, draw_boxes:bool=True, cache_size:int=8):
+        """
+        Args:
+            image_format (str): "jpg"、"webp" 或 "png"
+            quality (int): jpg / webp 的品質（0~100）
+            mode (str): "full" 傳送縮小後的整張影像，"crop" 傳送車輛周圍的裁切
+            output_size (tuple): "full" 模式的圖片大小，避免LINE API發送失敗
+            crop_margin (float): "crop" 模式在車輛範圍外額外保留的比例
+            crop_max_size (int): "crop" 模式圖片最長邊的上限
+            draw_boxes (bool): 是否畫出車輛位置
+            cache_size (int): 快取幾張影像的縮圖與編碼結果
+        """
+        if image_format not in self.ENCODE_PARAMS:
+            raise ValueError("不支援的圖片格式：{}".format(image_format))
+        if mode not in ("full", "crop"):
+            raise ValueError("未知的圖片模式：{}".format(mode))
+        self.image_format = image_format
+        self.quality = quality
+        self.mode = mode
+        self.output_size = output_size
+        self.crop_margin = crop_margin
+        self.crop_max_size = crop_max_size
+        self.draw_boxes = draw_boxes
+        self.cache_size = cache_size
+        self.base_cache = OrderedDict() # {frame_key: 縮小後的影像}
+        self.encoded_cache = OrderedDict() # {frame_key: 編碼後的 bytes}，不畫框時共用
+        self.cache_lock = threading.Lock() # 執行緒池中多個發送執行緒會同時編碼
+
+    def cache_get(self, cache:OrderedDict, frame_key):
+        with self.cache_lock:
+            if frame_key is None or frame_key not in cache:
+                return None
+            cache.move_to_end(frame_key)
+            return cache[frame_key]
+
+    def cache_put(self, cache:OrderedDict, frame_key, value) -> None:
+        if frame_key is None:
+            return
+        with self.cache_lock:
+            cache[frame_key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def to_bytes_io(self, buffer) -> BytesIO:
+        io_buf = BytesIO(buffer)
+        io_buf.name = "snapshot.{}".format(self.image_format) # 發送時依副檔名決定 MIME 類型
+        return io_buf
+
+    def imencode(self, image) -> bytes:
+        success, buffer = cv2.imencode("." + self.image_format, image, self.ENCODE_PARAMS[self.image_format](self.quality))
+        if not success:
+            raise ValueError("無法將圖片編碼為 {}".format(self.image_format))
+        return buffer.tobytes()
+
+    def encode(self, frame, vehicles:list=None, frame_key=None) -> BytesIO:
+        """將影像編碼為通知圖片
+
+        Args:
+            frame (cv2): 原始解析度影像
+            vehicles (list, optional): 要畫出的 Vehicle 列表
+            frame_key (optional): 影像的識別碼，None 表示不使用快取
+
+        Returns:
+            BytesIO: 編碼後的圖片，發生錯誤時回傳 None
+        """
         try:
-            x0, y0, x1, y1 = vehicle.position # 取得車輛位置
-            cv2.rectangle(result_frame, (x0, y0), (x1, y1), (0, 255, 0), 2) # 畫出車輛位置
-            result_frame=cv2.resize(result_frame,(640,360)) # 縮小圖片，避免LINE API發送失敗
-            _, buffer = cv2.imencode('.png', result_frame)
-            io_buf = BytesIO(buffer)
-            return io_buf
+            vehicles = vehicles or []
+            if self.mode == "crop" and vehicles:
+                return self.to_bytes_io(self.imencode(self.crop(frame, vehicles)))
+            if not vehicles or not self.draw_boxes:
+                # 不需要畫框，同一張影像的所有通知共用同一份編碼結果
+                encoded = self.cache_get(self.encoded_cache, frame_key)
+                if encoded is None:
+                    encoded = self.imencode(self.base(frame, frame_key))
+                    self.cache_put(self.encoded_cache, frame_key, encoded)
+                return self.to_bytes_io(encoded)
+            # 在共用的縮圖上畫框，避免每則通知都複製與縮小原始影像
+            result_frame = self.base(frame, frame_key).copy()
+            scale_x = self.output_size[0] / frame.shape[1]
+            scale_y = self.output_size[1] / frame.shape[0]
+            for vehicle in vehicles:
+                x0, y0, x1, y1 = vehicle.position # 取得車輛位置
+                cv2.rectangle(result_frame, (int(x0 * scale_x), int(y0 * scale_y)), (int(x1 * scale_x), int(y1 * scale_y)), (0, 255, 0), 2) # 畫出車輛位置
+            return self.to_bytes_io(self.imencode(result_frame))
         except Exception as e:
-            logging.error("'draw_rectangle'方法錯誤，無法畫出車輛位置：{}".format(e))
-            return result_frame
+            logging.error("'encode'方法錯誤，無法編碼通知圖片：{}".format(e))
+            return None
+
+    def base(self, frame, frame_key=None):
+        """取得縮小後的影像，同一個 frame_key 只縮小一次"""
+        base = self.cache_get(self.base_cache, frame_key)
+        if base is None:
+            base = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA) # 縮小圖片，避免LINE API發送失敗
+            self.cache_put(self.base_cache, frame_key, base)
+        return base
+
+    def crop(self, frame, vehicles:list):
+        """裁切所有車輛周圍的區域，並畫出車輛位置"""
+        positions = [vehicle.position for vehicle in vehicles]
+        x0 = min(position[0] for position in positions)
+        y0 = min(position[1] for position in positions)
+        x1 = max(position[2] for position in positions)
+        y1 = max(position[3] for position in positions)
+        margin_x = int((x1 - x0) * self.crop_margin)
+        margin_y = int((y1 - y0) * self.crop_margin)
+        height, width = frame.shape[:2]
+        crop_x0, crop_y0 = max(0, x0 - margin_x), max(0, y0 - margin_y)
+        crop_x1, crop_y1 = min(width, x1 + margin_x), min(height, y1 + margin_y)
+        result_frame = frame[crop_y0:crop_y1, crop_x0:crop_x1].copy()
+        if self.draw_boxes:
+            for px0, py0, px1, py1 in positions:
+                cv2.rectangle(result_frame, (px0 - crop_x0, py0 - crop_y0), (px1 - crop_x0, py1 - crop_y0), (0, 255, 0), 2)
+        longest = max(result_frame.shape[:2])
+        if longest > self.crop_max_size:
+            scale = self.crop_max_size / longest
+            result_frame = cv2.resize(result_frame, (max(1, int(result_frame.shape[1] * scale)), max(1, int(result_frame.shape[0] * scale))),
+                                      interpolation=cv2.INTER_AREA)
+        return result_frame
+
+
+class AlertCoalescer:
+    """位於通知佇列與 NotificationManager 之間，
+    將同一個視窗在 coalesce_window 秒內的通知合併成一則訊息（一張圖畫出所有車輛），
+    並限制每位管理員每分鐘最多發送 max_per_minute 則通知，超過時繼續合併等待下一次額度
+    """
+    def __init__(self, communication_module:NotificationManager, coalesce_window:float=3.0, max_per_minute:int=10, on_result=None):
+        self.communication_module = communication_module
+        self.on_result = on_result # on_result(success: bool)，每則訊息發送完成時呼叫，用於統計
+        self.coalesce_window = coalesce_window # 合併時間窗（秒）
+        self.max_per_minute = max_per_minute # 每位管理員每分鐘的發送上限
+        self.pending = {} # {視窗 ID: {"first_time", "message", "image", "frame_key", "vehicles"}}
+        self.sent_times = {} # {管理員 token: deque(發送時間)}
+
+    def add(self, notification_data:dict, now:float=None) -> None:
+        """加入一則通知，同一視窗尚未發送的通知會被合併
+
+        Args:
+            notification_data (dict): {"window_id", "message", "image", "frame_key", "vehicle"}
+            now (float, optional): 目前時間（time.monotonic）
+        """
+        now = time.monotonic() if now is None else now
+        window_id = notification_data["window_id"]
+        pending = self.pending.get(window_id)
+        if pending is None:
+            pending = {"first_time": now, "message": notification_data["message"], "image": None, "frame_key": None, "vehicles": {}}
+            self.pending[window_id] = pending
+        # 使用最新的影像，同一台車輛只保留一次
+        if notification_data.get("image") is not None:
+            pending["image"] = notification_data["image"]
+            pending["frame_key"] = notification_data.get("frame_key")
+        vehicle = notification_data.get("vehicle")
+        if vehicle is not None:
+            pending["vehicles"][vehicle.vehicle_id] = vehicle
+
+    def rate_key(self, window_id:str) -> str:
+        """以管理員 token 作為頻率限制的單位，沒有 token 時以視窗 ID 代替"""
+        manager_info = self.communication_module.get_manager_info(window_id)
+        return manager_info.get("token") or "window:{}".format(window_id)
+
+    def next_allowed_time(self, key:str, now:float) -> float:
+        """計算該管理員下一次可以發送的時間"""
+        sent = self.sent_times.setdefault(key, deque())
+        while sent and now - sent[0] >= 60:
+            sent.popleft()
+        if len(sent) < self.max_per_minute:
+            return now
+        return sent[0] + 60
+
+    def flush_due(self, now:float=None, force:bool=False) -> int:
+        """發送已經超過合併時間窗且未超過頻率限制的通知
+
+        Args:
+            now (float, optional): 目前時間（time.monotonic）
+            force (bool): 忽略合併時間窗（仍遵守頻率限制），例如停止時
+
+        Returns:
+            int: 發送的通知數量
+        """
+        now = time.monotonic() if now is None else now
+        sent_count = 0
+        for window_id in list(self.pending.keys()):
+            pending = self.pending[window_id]
+            if not force and now - pending["first_time"] < self.coalesce_window:
+                continue
+            key = self.rate_key(window_id)
+            if self.next_allowed_time(key, now) > now:
+                continue
+            self.pending.pop(window_id)
+            vehicles = list(pending["vehicles"].values())
+            future = self.communication_module.submit_notification(window_id=window_id,
+                                                                   message=self.build_message(pending["message"], vehicles),
+                                                                   image=pending["image"],
+                                                                   vehicles=vehicles,
+                                                                   frame_key=pending["frame_key"])
+            if self.on_result is not None and future is not None:
+                future.add_done_callback(lambda done: self.on_result(not done.exception() and bool(done.result())))
+            self.sent_times[key].append(now)
+            sent_count += 1
+        return sent_count
+
+    def build_message(self, message:str, vehicles:list) -> str:
+        """合併多台車輛時，在訊息中附上數量與車輛 ID"""
+        if len(vehicles) <= 1:
+            return message
+        return "{}：共 {} 台（ID：{}）".format(message, len(vehicles), ", ".join(str(vehicle.vehicle_id) for vehicle in vehicles))
+
+    def next_timeout(self, now:float=None, idle_timeout:float=1.0) -> float:
+        """距離下一則通知可以發送的秒數，用於通知執行緒等待佇列的逾時"""
+        now = time.monotonic() if now is None else now
+        if not self.pending:
+            return idle_timeout
+        deadlines = []
+        for window_id, pending in self.pending.items():
+            deadline = max(pending["first_time"] + self.coalesce_window, self.next_allowed_time(self.rate_key(window_id), now))
+            deadlines.append(deadline)
+        return min(max(min(deadlines) - now, 0.01), idle_timeout)
+
+
+class NotificationRouter:
+    """多螢幕時每個螢幕有自己的配置文件（視窗 ID 與管理員各自獨立），
+    視窗 ID 為 (螢幕名稱, 視窗 ID) 時交給該螢幕的 NotificationManager，其他視窗 ID 交給預設的 NotificationManager。
+    提供與 NotificationManager 相同的 get_manager_info / submit_notification，可以直接交給 AlertCoalescer
+    """
+    def __init__(self, default_manager:NotificationManager, managers:dict=None):
+        """
+        Args:
+            default_manager (NotificationManager): 主視窗選擇的螢幕使用的 NotificationManager
+            managers (dict, optional): {螢幕名稱: NotificationManager}
+        """
+        self.default_manager = default_manager
+        self.managers = dict(managers or {})
+
+    def add_manager(self, monitor_name, manager:NotificationManager) -> None:
+        self.managers[monitor_name] = manager
+
+    def route(self, window_id) -> tuple:
+        """回傳 (NotificationManager, 該螢幕配置中的視窗 ID)"""
+        if isinstance(window_id, tuple) and window_id[0] in self.managers:
+            return self.managers[window_id[0]], window_id[1]
+        return self.default_manager, window_id
+
+    def get_manager_info(self, window_id) -> dict:
+        manager, window_id = self.route(window_id)
+        return manager.get_manager_info(window_id)
+
+    def submit_notification(self, window_id, message:str, image=None, vehicle=None, vehicles=None, frame_key=None):
+        manager, window_id = self.route(window_id)
+        return manager.submit_notification(window_id=window_id, message=message, image=image, vehicle=vehicle,
+                                           vehicles=vehicles, frame_key=frame_key)
+
+    def close(self, wait:bool=True) -> None:
+        """關閉所有 NotificationManager"""
+        for manager in [self.default_manager] + list(self.managers.values()):
+            manager.close(wait=wait)
@@ -7,8 +7,12 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from module.monitor import MonitorManager
 from module.communication import NotificationManager
-from ultralytics import YOLO
-from datetime import datetime
+from module.zone import ZoneIndex, GridOverlay
+from module.track import Vehicle, TrackStore
+from module.annotation import AnnotatedFrame
+from module.profiles import select_profile, build_backend, autotune_profile
+from module.metrics import REGISTRY
+import time
 import cv2
 from utils.log import setup_logger
 import json
@@ -17,40 +21,67 @@ import numpy as np
 # 設置日誌處理器，支持指定編碼
 logging = setup_logger('detection', 'DetectionManager.log')
 
-# 定義 Vehicle 類別以表示檢測到的車輛
-class Vehicle:
-    def __init__(self, vehicle_id:int, vehicle_type:str, position:tuple):
-        self.vehicle_id = vehicle_id
-        self.vehicle_type = vehicle_type
-        self.position = position
-        self.last_seen = datetime.now()
-
-    def update_info(self, new_position:tuple) -> None :
-        """跟新車輛位置和最後偵測到的時間
-
-        Args:
-            new_position (tuple): description
-        """
-        self.position = new_position
-        self.last_seen = datetime.now()
-
-
 # 定義 DetectionManager 類別以協調框架和車輛檢測
 class DetectionManager:
-    def __init__(self, vehicle_detect_model_path, config_path, window_layout_str):
+    def __init__(self, vehicle_detect_model_path, config_path, window_layout_str, backend:str="torch", backend_options:dict=None,
+                 auto_tune:bool=False, target_fps:float=10.0, lazy_load:bool=False):
         # 初始化框架和車輛檢測模型，以及處理位置配置的 LocationManager
-        self.vehicle_model = YOLO(vehicle_detect_model_path)
+        # 模型與輸入大小依照佈局從 LAYOUT_DEFAULTS 選擇，vehicle_detect_model_path 為 None 時使用表中的模型；
+        # auto_tune 時在啟動時量測延遲，選擇達到 target_fps 的最大設定
+        # 推論後端決定模型如何執行（PyTorch 或 ONNX Runtime），追蹤與框框判斷的邏輯不受影響
+        # lazy_load 時第一次推論才載入模型，例如只測試框框與追蹤邏輯時不需要權重
+        if auto_tune and not vehicle_detect_model_path:
+            self.profile, self.backend, measurements = autotune_profile(window_layout_str, target_fps, backend, backend_options)
+            logging.info("自動調整量測結果（秒）：{}".format(measurements))
+        else:
+            self.profile = select_profile(window_layout_str, vehicle_detect_model_path)
+            self.backend = build_backend(self.profile, backend, backend_options)
+        if not lazy_load:
+            self.backend.load()
+        logging.info("車輛偵測推論後端：{}，佈局 {} 使用設定：{}".format(self.backend.describe(), window_layout_str, self.profile))
+        self.imgsz=self.profile["imgsz"] # 整張拼接畫面推論的輸入大小
         self.conf=0.6 # 設定信心閥值
         self.tracker="botsort.yaml" # 設定追蹤器
         self.iou=0.9 # 設定 IOA 閥值
         self.clas=[7] #貨車
-        self.vehicles={}
         self.limit_time=5 # 設定車輛離開畫面的時間限制
+        self.tracks=TrackStore(self.limit_time) # 車輛追蹤資料，以到期佇列回收離開畫面的車輛
+        self.vehicles=self.tracks.vehicles # {車輛 ID: Vehicle}，唯讀使用
+        self.config_path=config_path
         self.window_config=json.load(open(config_path, "r"))
         self.window_layout_str=window_layout_str
         self.frame=None # 儲存影像
         # 新增：預先計算框框座標
         self.precomputed_boxes = self.precompute_boxes()
+        self.zone_index = ZoneIndex(self.precomputed_boxes) # 框框索引，一次判斷所有車輛所屬框框
+        self.grid_overlay = GridOverlay(self.precomputed_boxes) # 框框與 ID 標籤的靜態覆蓋層
+        # 動態閘門：畫面沒有變化時略過 YOLO 推論
+        self.motion_gate=True # 是否啟用動態閘門
+        self.motion_threshold=6.0 # 每個框框灰階平均差異的閥值(0~255)
+        self.motion_size=(320, 180) # 做畫面差異時的縮小尺寸
+        self.motion_refresh_frames=50 # 連續略過幾張影像後強制推論一次，避免追蹤器失去同步
+        self.motion_reference=None # 上一次推論時的縮小灰階影像
+        self.motion_current=None # 目前影像的縮小灰階影像
+        self.motion_boxes=None # 縮小後的框框座標，依照影像大小計算
+        self.motion_frame_shape=None # motion_boxes 對應的影像大小
+        self.skipped_frames=0 # 目前連續略過推論的影像數
+        self.changed_zones=[] # 最近一次畫面有變化的框框 ID
+        self.last_anno_frame=None # 最近一次推論的 AnnotatedFrame，略過推論時沿用
+        self.event_store=None # EventStore，設定後記錄每台車輛出現與離開的事件
+        # 各階段的耗時與計數統計
+        self.stage_metrics = {stage: REGISTRY.stage(stage) for stage in ("motion", "inference", "tracking", "zone")}
+        self.skipped_counter = REGISTRY.counter("frames_skipped_total", "動態閘門略過推論的影像數")
+        self.new_vehicle_counter = REGISTRY.counter("vehicles_new_total", "新出現的車輛數")
+        REGISTRY.gauge("tracked_vehicles", "追蹤中的車輛數", callback=lambda: len(self.tracks))
+        # 推論模式："mosaic" 對整張拼接畫面推論，"tiles" 將每個框框裁切後批次推論
+        self.inference_mode="mosaic"
+        self.tile_imgsz=self.profile["tile_imgsz"] # 批次推論時每個框框的輸入大小
+        self.tile_trackers={} # {框框 ID: 追蹤器}，批次推論時每個框框各自追蹤
+
+    @property
+    def vehicle_model(self):
+        """車輛偵測模型，尚未載入時才載入"""
+        return self.backend.load()
 
     def precompute_boxes(self):
         boxes = {}
@@ -59,70 +90,288 @@ class DetectionManager:
             boxes[location_id] = np.array([x0, y0, x1, y1])
         return boxes
 
-    def garbage_collect(self):
-        """垃圾回收機制，如果車輛已經離開畫面超過 5 秒，則刪除該車輛，防止記憶體過度使用
+    def reload_boxes(self, boxes:dict=None) -> None:
+        """重新設定框框座標，例如擷取區域改變或配置更新時
+
+        Args:
+            boxes (dict, optional): {框框 ID: np.array([x0, y0, x1, y1])}，None 表示依照配置重新計算
+        """
+        self.precomputed_boxes = boxes if boxes is not None else self.precompute_boxes()
+        self.zone_index = ZoneIndex(self.precomputed_boxes)
+        self.grid_overlay = GridOverlay(self.precomputed_boxes) # 框框改變時才重新繪製覆蓋層
+        self.motion_boxes = None # 框框改變，縮小後的框框需重新計算
+        self.motion_reference = None
+        if self.inference_mode == "tiles":
+            self.reset_tracker() # 批次大小可能改變，每個框框的追蹤器需重新建立
+
+    def reload_config(self) -> None:
+        """重新讀取配置文件並重建框框，例如 LocationManager 在初始化時改寫了框框位置"""
+        with open(self.config_path, "r") as config_file:
+            self.window_config = json.load(config_file)
+        self.reload_boxes()
+
+    def on_config_updated(self, window_layout_str:str, boxes:dict) -> None:
+        """LocationManager 更新框框位置時的回呼，只處理目前使用的佈局
+
+        Args:
+            window_layout_str (str): 被更新的視窗佈局
+            boxes (dict): {框框 ID: np.array([x0, y0, x1, y1])}，目前擷取影像座標系的框框
+        """
+        if window_layout_str != self.window_layout_str:
+            return
+        self.reload_boxes(boxes)
+
+    def set_inference_mode(self, mode:str) -> None:
+        """切換推論模式
+
+        Args:
+            mode (str): "mosaic" 對整張拼接畫面推論，"tiles" 將每個框框裁切後批次推論
+        """
+        if mode not in ("mosaic", "tiles"):
+            raise ValueError("未知的推論模式：{}".format(mode))
+        if mode != self.inference_mode:
+            self.inference_mode = mode
+            self.reset_tracker()
+
+    def reset_tracker(self) -> None:
+        """移除 YOLO 預測器上的追蹤器與每個框框的追蹤器，下一次推論時重新建立；
+        追蹤 ID 可能重新編號，同時清空追蹤資料，避免新車輛沿用舊 ID 而不發出通知
+        """
+        predictor = getattr(self.backend.model, "predictor", None) # 模型尚未載入時不需要處理
+        if predictor is not None and hasattr(predictor, "trackers"):
+            del predictor.trackers
+        self.tile_trackers = {}
+        self.record_live_tracks()
+        self.tracks = TrackStore(self.limit_time)
+        self.vehicles = self.tracks.vehicles
+
+    def record_live_tracks(self) -> None:
+        """將追蹤中且位於框框內的車輛記錄到 event_store（更新最後出現時間與位置），
+        例如重設追蹤器或程式結束時，這些車輛不會再經過垃圾回收
+        """
+        if self.event_store is None:
+            return
+        for vehicle in self.tracks.values():
+            if vehicle.zone_id is not None:
+                self.event_store.record(vehicle)
+
+    def create_tracker(self):
+        """依照 self.tracker 的設定檔建立一個追蹤器（BOTSORT 或 BYTETracker）"""
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+        tracker_config = IterableSimpleNamespace(**yaml_load(check_yaml(self.tracker)))
+        return TRACKER_MAP[tracker_config.tracker_type](args=tracker_config, frame_rate=30)
+
+    def build_tile_trackers(self, location_ids:list) -> None:
+        """在任何追蹤器更新之前，一次建立所有框框的追蹤器。
+        追蹤器建構時會呼叫 reset_id() 把所有追蹤器共用的 ID 計數歸零，
+        如果在其他框框已經開始追蹤後才建立，不同框框的車輛會拿到相同的 ID
+
+        Args:
+            location_ids (list): 需要追蹤器的框框 ID
+        """
+        if self.tile_trackers and all(location_id in self.tile_trackers for location_id in location_ids):
+            return
+        if self.tile_trackers or len(self.tracks):
+            self.reset_tracker() # 已經追蹤過的 ID 會被重新編號，清空追蹤資料
+        self.tile_trackers = {location_id: self.create_tracker() for location_id in self.precomputed_boxes}
+        for location_id in location_ids:
+            if location_id not in self.tile_trackers:
+                self.tile_trackers[location_id] = self.create_tracker()
+
+    def detect_motion(self, frame:cv2) -> list:
+        """以縮小灰階影像的畫面差異，找出自上一次推論以來有變化的框框
+
+        Args:
+            frame (cv2): 目前的影像
+
+        Returns:
+            list: 有變化的框框 ID，沒有參考影像時回傳所有框框 ID
+        """
+        small = cv2.cvtColor(cv2.resize(frame, self.motion_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self.motion_boxes is None or self.motion_frame_shape != frame.shape[:2]:
+            # 依照影像大小將框框縮放到縮小影像的座標
+            self.motion_frame_shape = frame.shape[:2]
+            scale_x = self.motion_size[0] / frame.shape[1]
+            scale_y = self.motion_size[1] / frame.shape[0]
+            self.motion_boxes = {location_id: (int(x0 * scale_x), int(y0 * scale_y),
+                                               max(int(x1 * scale_x), int(x0 * scale_x) + 1),
+                                               max(int(y1 * scale_y), int(y0 * scale_y) + 1))
+                                 for location_id, (x0, y0, x1, y1) in self.precomputed_boxes.items()}
+            self.motion_reference = None
+        reference = self.motion_reference
+        self.motion_current = small
+        if reference is None:
+            return list(self.precomputed_boxes.keys()) or ["all"]
+        diff = cv2.absdiff(small, reference)
+        if not self.motion_boxes:
+            return ["all"] if diff.mean() > self.motion_threshold else []
+        changed = []
+        for location_id, (x0, y0, x1, y1) in self.motion_boxes.items():
+            if diff[y0:y1, x0:x1].mean() > self.motion_threshold:
+                changed.append(location_id)
+        return changed
+
+    def garbage_collect(self, now:float=None) -> list:
+        """垃圾回收機制，如果車輛已經離開畫面超過 5 秒，則刪除該車輛，防止記憶體過度使用。
+        只會檢查到期佇列中已經到期的車輛，不會掃描所有車輛
+
+        Args:
+            now (float, optional): 目前時間（time.monotonic），同一張影像只取一次
+
+        Returns:
+            list: 被刪除的 Vehicle
         """
         try:
-            # 儲存需要刪除的車輛 ID
-            need_to_be_deleted_vehicle_ids = [] 
-            # 如果 self.vehicles 是空的，則跳過
-            if self.vehicles is None: 
-                return
-            # 檢查每個車輛
-            for vehicle_id, vehicle in self.vehicles.items(): # 檢查每個類別的車輛
-                if (datetime.now() - vehicle.last_seen).total_seconds() > self.limit_time: # 如果車輛已經離開畫面超過 5 秒，則刪除該車輛
-                    need_to_be_deleted_vehicle_ids.append(vehicle_id)
-            # 刪除車輛
-            for vehicle_id in need_to_be_deleted_vehicle_ids:
-                print("車輛 ID：{} 已經離開畫面超過 {} 秒，刪除該車輛".format(vehicle_id, self.limit_time))
-                self.vehicles.pop(vehicle_id) 
+            now = time.monotonic() if now is None else now
+            removed = self.tracks.collect(now)
+            for vehicle in removed:
+                print("車輛 ID：{} 已經離開畫面超過 {} 秒，刪除該車輛".format(vehicle.vehicle_id, self.limit_time))
+                if self.event_store is not None and vehicle.zone_id is not None:
+                    self.event_store.record(vehicle) # 更新最後出現時間與位置
+            return removed
         except Exception as e:
             logging.error("'garbage_collect'方法錯誤，無法執行垃圾回收：{}".format(e))
+            return []
 
-    def detect(self, frame:cv2) -> list:
+    def detect(self, frame:cv2, frame_key=None) -> list:
         """檢測車輛，在一開始會執行垃圾回收，當車輛離開畫面超過 5 秒，則刪除該車輛，接者會執行車輛追蹤，
         並將車輛儲存至 self.vehicles，最後會執行 detect_location() 方法，將車輛位置位於哪個框框回傳
 
         Args:
             frame (cv2): description
+            frame_key (int, optional): 影像序號，記錄在偵測事件中
 
         Returns:
-            tuple: ((車輛位置位於哪個框框、Vehicle 實例), anno_frame)
+            tuple: ((車輛位置位於哪個框框、Vehicle 實例), AnnotatedFrame)，標註影像需要顯示時才以 render() 繪製
         """
-        self.frame=frame.copy()
+        self.frame=frame # 不再於偵測時繪製，原始影像不會被修改，不需要複製
         try:
             # 儲存需要偵測位置的車輛
             need_to_detect_location_vehicles={} 
+            # 同一張影像的所有車輛共用一次取得的時間
+            now = time.monotonic()
             # 執行垃圾回收
-            self.garbage_collect()
-            vehicle_results = self.vehicle_model.track(self.frame, stream=True, classes=self.clas, tracker=self.tracker, conf=self.conf,iou=self.iou, verbose=False, persist=True) # 執行車輛檢測
-            
-            # 繪製車輛位置
-            for vehicle_result in vehicle_results:
-                self.frame=vehicle_result.plot()
-                vehicle_datas = vehicle_result.boxes.data
-                vehicle_names = vehicle_result.names
-                # 如果該車輛不是追蹤的，則跳過
-                if not vehicle_result.boxes.is_track: 
-                    continue
-                # 檢查每個車輛
-                for vehicle_data in vehicle_datas:
-                    x_min, y_min, x_max, y_max, vehicle_id, _, class_id = vehicle_data # 取得車輛位置和類別
-                    class_id = int(class_id)
-                    vehicle_id = int(vehicle_id)
-                    vehicle_type = vehicle_names[class_id]
-                    # 如果該車輛 ID 是新的，則創建一個 Vehicle 實例並加入到 current_vehicles
-                    if vehicle_id not in self.vehicles:
-                        new_vehicle = Vehicle(vehicle_id, vehicle_type, (int(x_min), int(y_min),int(x_max),int(y_max))) # 創建一個 Vehicle 實例
+            tracking_start = time.perf_counter()
+            self.garbage_collect(now)
+            tracking_seconds = time.perf_counter() - tracking_start
+            # 動態閘門：所有框框都沒有變化時略過推論，並延長現有車輛的存活時間
+            if self.motion_gate:
+                with self.stage_metrics["motion"].time():
+                    self.changed_zones = self.detect_motion(self.frame)
+                if not self.changed_zones and self.skipped_frames < self.motion_refresh_frames and self.last_anno_frame is not None:
+                    self.skipped_frames += 1
+                    self.skipped_counter.inc()
+                    self.tracks.keep_alive(now)
+                    self.stage_metrics["tracking"].observe(tracking_seconds)
+                    return ([], self.last_anno_frame)
+                self.skipped_frames = 0
+                self.motion_reference = self.motion_current
+            # 執行車輛檢測，回傳 [(框框 ID 或 None, 車輛 ID, 車輛類別, 車輛位置), ...]
+            with self.stage_metrics["inference"].time():
+                if self.inference_mode == "tiles":
+                    detections, anno_frame = self.track_tiles()
+                else:
+                    detections, anno_frame = self.track_mosaic()
+            tracking_start = time.perf_counter()
+            # 批次推論時已知車輛所屬框框，不需要再偵測位置
+            located_results = []
+            # 檢查每個車輛
+            for location_id, vehicle_id, vehicle_type, position in detections:
+                # 如果該車輛 ID 是新的，則創建一個 Vehicle 實例並加入到 current_vehicles
+                if vehicle_id not in self.tracks:
+                    new_vehicle = Vehicle(vehicle_id, vehicle_type, position, now) # 創建一個 Vehicle 實例
+                    self.tracks.add(new_vehicle) # 將該車輛加入到追蹤資料
+                    if location_id is None:
                         need_to_detect_location_vehicles[vehicle_id] = new_vehicle # 將該車輛加入到 need_to_detect_location_vehicles
-                        self.vehicles[vehicle_id] = new_vehicle # 將該車輛加入到 self.vehicles
-                    else:  # 代表該車輛 ID 已經存在，此車輛可能停止於此畫面不動，則更新該車輛的位置和時間，且不需要偵測位置，因為已經存在
-                        self.vehicles[vehicle_id].update_info( (int(x_min), int(y_min),int(x_max),int(y_max)) ) # 更新該車輛的位置和時間
-            return (self.detect_location(need_to_detect_location_vehicles),self.frame) # 執行 detect_location() 方法，將車輛位置位於哪個框框回傳
+                    else:
+                        located_results.append((location_id, new_vehicle))
+                else:  # 代表該車輛 ID 已經存在，此車輛可能停止於此畫面不動，則更新該車輛的位置和時間，且不需要偵測位置，因為已經存在
+                    self.tracks[vehicle_id].update_info(position, now) # 更新該車輛的位置和時間
+            tracking_seconds += time.perf_counter() - tracking_start
+            with self.stage_metrics["zone"].time():
+                results = located_results + self.detect_location(need_to_detect_location_vehicles) # 執行 detect_location() 方法，將車輛位置位於哪個框框回傳
+            # 記錄每台車輛所屬的框框
+            tracking_start = time.perf_counter()
+            for location_id, vehicle in results:
+                self.tracks.set_zone(vehicle.vehicle_id, location_id)
+                if self.event_store is not None:
+                    self.event_store.record(vehicle, frame_seq=frame_key)
+            self.stage_metrics["tracking"].observe(tracking_seconds + time.perf_counter() - tracking_start)
+            self.new_vehicle_counter.inc(len(results))
+            self.last_anno_frame = anno_frame
+            return (results, anno_frame)
         except Exception as e:
             logging.error("'detect'方法錯誤，無法執行車輛檢測：{}".format(e))
         
 
+    def track_mosaic(self) -> tuple:
+        """對整張拼接畫面執行車輛追蹤
+
+        Returns:
+            tuple: ([(None, 車輛 ID, 車輛類別, 車輛位置), ...], AnnotatedFrame)，框框 ID 需由 detect_location 判斷
+        """
+        detections = []
+        anno_frame = AnnotatedFrame(self.frame, overlay=self.grid_overlay)
+        vehicle_results = self.vehicle_model.track(self.frame, stream=True, classes=self.clas, tracker=self.tracker, conf=self.conf,iou=self.iou,
+                                                   imgsz=self.imgsz, verbose=False, persist=True) # 執行車輛檢測
+        for vehicle_result in vehicle_results:
+            anno_frame.result = vehicle_result # 保留推論結果，需要顯示時才以 plot() 繪製車輛位置
+            vehicle_names = vehicle_result.names
+            # 如果該車輛不是追蹤的，則跳過
+            if not vehicle_result.boxes.is_track:
+                continue
+            for vehicle_data in vehicle_result.boxes.data:
+                x_min, y_min, x_max, y_max, vehicle_id, _, class_id = vehicle_data # 取得車輛位置和類別
+                detections.append((None, int(vehicle_id), vehicle_names[int(class_id)],
+                                   (int(x_min), int(y_min), int(x_max), int(y_max))))
+        return detections, anno_frame
+
+    def track_tiles(self) -> tuple:
+        """將每個框框裁切出來，以一次批次推論偵測車輛，每個框框的偵測結果交給該框框自己的追蹤器，
+        再把座標換算回整張影像。YOLO 的 track() 對非串流的輸入只建立一個追蹤器，
+        會把所有框框當成連續的影像互相配對，因此這裡自行管理追蹤器
+
+        Returns:
+            tuple: ([(框框 ID, 車輛 ID, 車輛類別, 車輛位置), ...], AnnotatedFrame)
+        """
+        detections = []
+        anno_frame = AnnotatedFrame(self.frame, overlay=self.grid_overlay)
+        height, width = self.frame.shape[:2]
+        location_ids = []
+        offsets = []
+        crops = []
+        for location_id, (x0, y0, x1, y1) in self.precomputed_boxes.items():
+            x0, y0 = max(int(x0), 0), max(int(y0), 0)
+            x1, y1 = min(int(x1), width), min(int(y1), height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            location_ids.append(location_id)
+            offsets.append((x0, y0))
+            crops.append(self.frame[y0:y1, x0:x1])
+        if not crops:
+            return detections, anno_frame
+        vehicle_results = self.vehicle_model.predict(crops, classes=self.clas, conf=self.conf, iou=self.iou,
+                                                     imgsz=self.tile_imgsz, verbose=False)
+        self.build_tile_trackers(location_ids)
+        zone_of_vehicle = {} # {車輛 ID: 框框 ID}，檢查不同框框是否出現相同的車輛 ID
+        for location_id, (offset_x, offset_y), vehicle_result in zip(location_ids, offsets, vehicle_results):
+            vehicle_names = vehicle_result.names
+            tracker = self.tile_trackers[location_id]
+            # 每個框框的追蹤器每張影像只更新一次，沒有偵測到車輛時也更新，讓失去追蹤的計時正確
+            tracks = tracker.update(vehicle_result.boxes.cpu().numpy(), vehicle_result.orig_img)
+            for vehicle_data in tracks:
+                x_min, y_min, x_max, y_max, vehicle_id, _, class_id = vehicle_data[:7]
+                position = (int(x_min) + offset_x, int(y_min) + offset_y, int(x_max) + offset_x, int(y_max) + offset_y)
+                vehicle_type = vehicle_names[int(class_id)]
+                other_location_id = zone_of_vehicle.setdefault(int(vehicle_id), location_id)
+                if other_location_id != location_id:
+                    logging.error("'track_tiles'方法錯誤，框框 {} 與 {} 在同一張影像中出現相同的車輛 ID：{}".format(other_location_id, location_id, int(vehicle_id)))
+                anno_frame.boxes.append((int(vehicle_id), vehicle_type, position)) # 需要顯示時才繪製車輛位置
+                detections.append((location_id, int(vehicle_id), vehicle_type, position))
+        return detections, anno_frame
+
     def detect_location(self, need_to_detect_location_vehicles: dict) -> list:
         """檢測車輛位置位於哪個框框
 
@@ -134,26 +383,12 @@ class DetectionManager:
         """
         results = []
 
-        # 繪製所有框框
-        for location_id, box in self.precomputed_boxes.items():
-            x0, y0, x1, y1 = box
-            cv2.rectangle(self.frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
-                    # 計算框框的中心點
-            center_x = x0 + (x1 - x0) // 2
-            center_y = y0 + (y1 - y0) // 2
-            cv2.putText(self.frame, "ID:{}".format(location_id), (center_x, center_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        # 檢查每個車輛
-        for vehicle_id, vehicle in need_to_detect_location_vehicles.items():
-            vehicle_x0, vehicle_y0, vehicle_x1, vehicle_y1 = vehicle.position
-            # 計算車輛中心點，使用NP陣列來計算，加快速度
-            vehicle_center = np.array([(vehicle_x0 + vehicle_x1) / 2, (vehicle_y0 + vehicle_y1) / 2])
-
-            for location_id, box in self.precomputed_boxes.items():
-                x0, y0, x1, y1 = box
-                # 如果車輛中心點位於框框內，則將該車輛加入到 results
-                if x0 <= vehicle_center[0] <= x1 and y0 <= vehicle_center[1] <= y1:
-                    results.append((location_id, vehicle))
+        # 一次判斷所有車輛中心點所屬的框框，如果車輛中心點位於框框內，則將該車輛加入到 results
+        vehicles = list(need_to_detect_location_vehicles.values())
+        location_ids = self.zone_index.assign([vehicle.position for vehicle in vehicles])
+        for location_id, vehicle in zip(location_ids, vehicles):
+            if location_id is not None:
+                results.append((location_id, vehicle))
 
         return results
 
@@ -163,7 +398,7 @@ class DetectionManager:
 if __name__ == "__main__":
     # 初始化 MonitorManager
     monitor = MonitorManager(window_name="副視窗")
-    detection_manager = DetectionManager(vehicle_detect_model_path="yolov8x.pt",
+    detection_manager = DetectionManager(vehicle_detect_model_path=None, # 依照佈局選擇模型
                                         config_path="data/window_admin_settings.json",
                                         window_layout_str="4x4")
     communication_module = NotificationManager(config_path='data/window_admin_settings.json',
@@ -171,7 +406,7 @@ if __name__ == "__main__":
     while True:
         img = monitor.temp_get_frame()
         results,anno_frame = detection_manager.detect(img)
-        cv2.imshow("副視窗",anno_frame)
+        cv2.imshow("副視窗",anno_frame.render())
         cv2.waitKey(1)
         if results is not None:
             for result in results:
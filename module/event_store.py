@@ -0,0 +1,228 @@
+# event_store.py
+# 用途：車輛偵測事件的資料庫（SQLite WAL 模式），偵測迴圈只把事件放入有上限的佇列，
+# 由背景執行緒批次寫入，依照時間與框框建立索引，可以快速查詢「昨晚 7 號框的所有卡車」。
+# 每台車輛只有一列（UPSERT），離開畫面或程式結束時更新最後出現時間，而不是追加一筆離開事件
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from utils.log import setup_logger
+from module.metrics import REGISTRY
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('event_store', 'EventStore.log')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    layout TEXT,
+    track_id INTEGER NOT NULL,
+    zone TEXT,
+    vehicle_type TEXT,
+    x0 INTEGER, y0 INTEGER, x1 INTEGER, y1 INTEGER,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    stay_frames INTEGER,
+    frame_seq INTEGER,
+    snapshot TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_detections_track ON detections (run_id, track_id, first_seen);
+CREATE INDEX IF NOT EXISTS idx_detections_time ON detections (first_seen);
+CREATE INDEX IF NOT EXISTS idx_detections_zone_time ON detections (zone, first_seen);
+"""
+
+# 同一台車輛（同一次執行、追蹤 ID 與第一次出現時間）只保留一列，之後的紀錄更新最後出現時間與位置
+UPSERT = """
+INSERT INTO detections (run_id, layout, track_id, zone, vehicle_type, x0, y0, x1, y1, first_seen, last_seen, stay_frames, frame_seq, snapshot)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (run_id, track_id, first_seen) DO UPDATE SET
+    zone = COALESCE(excluded.zone, zone),
+    x0 = excluded.x0, y0 = excluded.y0, x1 = excluded.x1, y1 = excluded.y1,
+    last_seen = MAX(last_seen, excluded.last_seen),
+    stay_frames = MAX(stay_frames, excluded.stay_frames),
+    frame_seq = COALESCE(frame_seq, excluded.frame_seq),
+    snapshot = COALESCE(snapshot, excluded.snapshot)
+"""
+
+COLUMNS = ("id", "run_id", "layout", "track_id", "zone", "vehicle_type", "x0", "y0", "x1", "y1",
+           "first_seen", "last_seen", "stay_frames", "frame_seq", "snapshot")
+
+
+def to_timestamp(value):
+    """將 datetime 或 "YYYY-mm-dd HH:MM:SS" 轉為 Unix 時間，數字直接回傳"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class EventStore:
+    """偵測事件的資料庫。record() 不會阻塞，佇列已滿時丟棄事件並計數；
+    背景執行緒每 flush_interval 秒或累積 batch_size 筆時以一個交易寫入
+    """
+    def __init__(self, path:str="data/events.db", layout:str=None, batch_size:int=256, flush_interval:float=1.0, maxsize:int=10000):
+        """
+        Args:
+            path (str): 資料庫路徑
+            layout (str, optional): 目前的視窗佈局，記錄在每一筆事件中
+            batch_size (int): 每個交易最多寫入的事件數
+            flush_interval (float): 最多等待多少秒就寫入一次
+            maxsize (int): 佇列上限，寫入跟不上時丟棄新的事件
+        """
+        self.path = path
+        self.layout = layout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.run_id = uuid.uuid4().hex[:12] # 追蹤 ID 每次執行都會重新編號，以 run_id 區分
+        self.clock_offset = time.time() - time.monotonic() # 將 Vehicle 的 time.monotonic 轉為 Unix 時間
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.written = 0
+        self.dropped = 0
+        self.recorded_counter = REGISTRY.counter("events_written_total", "寫入資料庫的偵測事件數")
+        self.dropped_counter = REGISTRY.counter("events_dropped_total", "事件佇列已滿而丟棄的偵測事件數")
+        REGISTRY.gauge("event_queue_depth", "等待寫入資料庫的偵測事件數", callback=self.queue.qsize)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as connection: # 在建構時建立資料表，路徑錯誤時立即發現
+            connection.executescript(SCHEMA)
+        self.thread = threading.Thread(target=self.run, name="EventStoreWriter", daemon=True)
+        self.thread.start()
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL") # 寫入時不阻塞查詢
+        connection.execute("PRAGMA synchronous=NORMAL") # WAL 模式下仍能保證資料庫一致，只是斷電時可能遺失最後幾筆
+        return connection
+
+    def record(self, vehicle, frame_seq:int=None, snapshot:str=None) -> bool:
+        """記錄一台車輛目前的狀態，只放入佇列，不會阻塞
+
+        Args:
+            vehicle (Vehicle): 車輛，同一台車輛可以記錄多次（出現時與離開時），資料庫中只會有一列
+            frame_seq (int, optional): 第一次記錄時的影像序號
+            snapshot (str, optional): 通知圖片等快照的參考（路徑或識別碼）
+
+        Returns:
+            bool: 是否放入佇列
+        """
+        x0, y0, x1, y1 = (int(value) for value in vehicle.position)
+        event = (self.run_id, self.layout, int(vehicle.vehicle_id), vehicle.zone_id, vehicle.vehicle_type, x0, y0, x1, y1,
+                 vehicle.first_seen + self.clock_offset, vehicle.last_seen + self.clock_offset, vehicle.stay_frames, frame_seq, snapshot)
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_counter.inc()
+            return False
+
+    def run(self) -> None:
+        """背景寫入迴圈，收到 None 時寫完剩下的事件後結束"""
+        connection = self.connect()
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stopping = True
+                    batch = [event for event in batch if event is not None]
+                if batch:
+                    self.write(connection, batch)
+        finally:
+            connection.close()
+
+    def write(self, connection:sqlite3.Connection, batch:list) -> None:
+        try:
+            with connection: # 一個交易寫入整批事件
+                connection.executemany(UPSERT, batch)
+            self.written += len(batch)
+            self.recorded_counter.inc(len(batch))
+        except Exception as e:
+            logging.error("'EventStore.write'方法錯誤，無法寫入 {} 筆事件：{}".format(len(batch), e))
+
+    def close(self, timeout:float=5.0) -> None:
+        """寫完佇列中的事件並停止背景執行緒"""
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            logging.error("'EventStore.close'方法錯誤，佇列已滿，尚未寫入的事件將會遺失")
+            return
+        self.thread.join(timeout=timeout)
+
+    def query(self, zone:str=None, vehicle_type:str=None, since=None, until=None, limit:int=1000) -> list:
+        """查詢第一次出現時間位於 [since, until) 的車輛
+
+        Args:
+            zone (str, optional): 框框 ID
+            vehicle_type (str, optional): 車輛類別，例如 "truck"
+            since, until (float | datetime | str, optional): Unix 時間、datetime 或 ISO 格式字串
+            limit (int): 最多回傳的筆數，依照第一次出現時間排序
+
+        Returns:
+            list: [{欄位: 值}, ...]
+        """
+        conditions, parameters = [], []
+        if zone is not None:
+            conditions.append("zone = ?")
+            parameters.append(str(zone))
+        if vehicle_type is not None:
+            conditions.append("vehicle_type = ?")
+            parameters.append(vehicle_type)
+        if since is not None:
+            conditions.append("first_seen >= ?")
+            parameters.append(to_timestamp(since))
+        if until is not None:
+            conditions.append("first_seen < ?")
+            parameters.append(to_timestamp(until))
+        sql = "SELECT {} FROM detections".format(", ".join(COLUMNS))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY first_seen LIMIT ?"
+        parameters.append(limit)
+        connection = self.connect()
+        try:
+            return [dict(zip(COLUMNS, row)) for row in connection.execute(sql, parameters)]
+        finally:
+            connection.close()
+
+    def count_by_zone(self, since=None, until=None, vehicle_type:str=None) -> dict:
+        """各框框在時間範圍內出現的車輛數，{框框 ID: 數量}"""
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("first_seen >= ?")
+            parameters.append(to_timestamp(since))
+        if until is not None:
+            conditions.append("first_seen < ?")
+            parameters.append(to_timestamp(until))
+        if vehicle_type is not None:
+            conditions.append("vehicle_type = ?")
+            parameters.append(vehicle_type)
+        sql = "SELECT zone, COUNT(*) FROM detections"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " GROUP BY zone"
+        connection = self.connect()
+        try:
+            return dict(connection.execute(sql, parameters).fetchall())
+        finally:
+            connection.close()
@@ -5,53 +5,210 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from module.monitor import MonitorManager
 import json
+import time
 import cv2
-from ultralytics import YOLO
+import numpy as np
 
 # 設置日誌處理器，支持指定編碼
 from utils.log import setup_logger
 logging = setup_logger('location', 'LocationManager.log')
 
 
+def write_json_atomic(path:str, data, retries:int=5) -> None:
+    """先寫入暫存檔再取代原檔，其他執行緒同時讀取時不會讀到寫一半的內容。
+    Windows 上檔案正被讀取時無法取代，短暫等待後重試
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as temp_file:
+        json.dump(data, temp_file, indent=4, ensure_ascii=False)
+    for attempt in range(retries):
+        try:
+            os.replace(temp_path, path)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.05)
+
+
 class LocationManager:
-    def __init__(self, config_path, monitor: MonitorManager):
+    def __init__(self, config_path, monitor: MonitorManager, cache_path:str="data/layout_cache.json", auto_initialize:bool=True):
         self.config_path = config_path
         self.config = json.load(open(config_path, "r"))
         self.monitor = monitor
-        self.initialize_window_config()
+        self.config_listeners = [] # 框框位置更新時要通知的回呼函式
+        # 定位結果快取：螢幕與網格邊框沒有改變時，直接沿用上一次的定位結果，不載入定位模型
+        self.cache_path = cache_path
+        self.cache_max_entries = 8 # 最多保留幾組螢幕的定位結果
+        self.profile_bins = (160, 90) # 網格邊框特徵的 (欄, 列) 數
+        self.fingerprint_tolerance = 2 # 欄與列特徵各自允許不同的位元數
+        if auto_initialize: # 不需要定位時（例如基準測試）可以略過擷取螢幕與載入定位模型
+            self.initialize_window_config()
 
-    def initialize_window_config(self):
+    def initialize_window_config(self, use_cache:bool=True):
         """
-        初始化視窗配置
-        參數：無
+        初始化視窗配置，先以螢幕指紋查詢快取，沒有命中時才載入定位模型
+        參數：use_cache (bool) 是否使用定位結果快取
         回傳：無
         """
         try:
             #img = self.monitor.temp_get_frame()
-            img = self.monitor.capture_frame()
+            img = self.monitor.capture_frame(use_region=False) # 定位需要完整螢幕畫面
             frame = cv2.resize(img, (1280, 720))
-            model = YOLO("weights/frame_detect.pt")
-            results = model(frame)
-            detections = results[0].boxes.data
-            names = results[0].names
-
-            # 尋找2x2, 3x3, 4x4物件並計算frame大小
-            for detection in detections:
-                class_id = int(detection[-1])
-                object_name = names[class_id]
-                if object_name in ["2x2", "3x3", "4x4"]:
-                    x_min, y_min, x_max, y_max, _, _ = detection
-                    object_width = x_max - x_min
-                    object_height = y_max - y_min
-                    size = int(object_name.split("x")[0])
-                    frame_width = object_width / size
-                    frame_height = object_height / size
-                    start_x, start_y = x_min, y_min
-                    self.update_config(object_name, size, start_x, start_y, frame_width, frame_height, frame)
-                    break  # 假設一次只處理一種物件配置
+            fingerprint = self.compute_fingerprint(frame)
+            layout = self.lookup_layout_cache(fingerprint) if use_cache else None
+            if layout is not None:
+                logging.info("螢幕指紋命中定位快取，沿用 {} 配置".format(layout["object_name"]))
+            else:
+                layout = self.detect_layout(frame)
+                if layout is None:
+                    return
+                self.store_layout_cache(fingerprint, layout)
+            self.apply_layout(layout, frame)
         except Exception as e:
             logging.error("'initialize_window_config'方法錯誤，無法初始化視窗資訊：{}".format(e))
 
+    def detect_layout(self, frame) -> dict:
+        """以定位模型找出 2x2、3x3、4x4 網格
+
+        Args:
+            frame (cv2): 1280x720 的螢幕畫面
+
+        Returns:
+            dict: {"object_name", "size", "start_x", "start_y", "frame_width", "frame_height"}，找不到網格時回傳 None
+        """
+        from ultralytics import YOLO # 延遲匯入，只有需要定位時才載入 torch
+        model = YOLO("weights/frame_detect.pt")
+        results = model(frame)
+        detections = results[0].boxes.data
+        names = results[0].names
+
+        # 尋找2x2, 3x3, 4x4物件並計算frame大小
+        for detection in detections:
+            class_id = int(detection[-1])
+            object_name = names[class_id]
+            if object_name in ["2x2", "3x3", "4x4"]:
+                x_min, y_min, x_max, y_max, _, _ = detection
+                object_width = x_max - x_min
+                object_height = y_max - y_min
+                size = int(object_name.split("x")[0])
+                return {
+                    "object_name": object_name,
+                    "size": size,
+                    "start_x": float(x_min),
+                    "start_y": float(y_min),
+                    "frame_width": float(object_width / size),
+                    "frame_height": float(object_height / size),
+                }  # 假設一次只處理一種物件配置
+        logging.warning("定位模型沒有找到網格")
+        return None
+
+    def apply_layout(self, layout:dict, frame=None) -> None:
+        """套用定位結果，框框位置與配置文件相同時不改寫配置文件"""
+        positions = self.compute_positions(layout["size"], layout["start_x"], layout["start_y"],
+                                           layout["frame_width"], layout["frame_height"])
+        current = self.config.get(layout["object_name"], {})
+        if all(current.get(frame_key, {}).get("position") == position for frame_key, position in positions.items()):
+            return
+        self.update_config(layout["object_name"], layout["size"], layout["start_x"], layout["start_y"],
+                           layout["frame_width"], layout["frame_height"], frame)
+
+    def compute_fingerprint(self, frame) -> dict:
+        """計算螢幕指紋：螢幕位置大小，加上網格邊框的欄/列特徵。
+        網格邊框是貫穿整個畫面的直線，沿欄或列平均梯度後會形成明顯的峰值，
+        攝影機畫面內容的梯度平均後相對平坦，因此畫面內容變化不會改變指紋
+
+        Args:
+            frame (cv2): 1280x720 的螢幕畫面
+
+        Returns:
+            dict: {"screen": [left, top, width, height], "columns": "0101...", "rows": "0101..."}
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (self.profile_bins[0] * 4, self.profile_bins[1] * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+        column_profile = np.abs(np.diff(small, axis=1)).mean(axis=0) # 垂直邊框在欄方向的梯度
+        row_profile = np.abs(np.diff(small, axis=0)).mean(axis=1) # 水平邊框在列方向的梯度
+        screen = self.monitor.screen or {}
+        return {
+            "screen": [screen.get("left"), screen.get("top"), screen.get("width"), screen.get("height")],
+            "columns": self.profile_bits(column_profile, self.profile_bins[0]),
+            "rows": self.profile_bits(row_profile, self.profile_bins[1]),
+        }
+
+    @staticmethod
+    def profile_bits(profile:np.ndarray, bins:int) -> str:
+        """將梯度特徵縮小為 bins 格，明顯高於平均的格子記為 1"""
+        profile = np.array([chunk.max() for chunk in np.array_split(profile, bins)])
+        threshold = profile.mean() + 2 * profile.std()
+        return "".join("1" if value > threshold else "0" for value in profile)
+
+    def fingerprint_matches(self, fingerprint:dict, cached:dict) -> bool:
+        """螢幕位置大小相同，且欄/列特徵的差異在容許範圍內"""
+        if fingerprint["screen"] != cached.get("screen"):
+            return False
+        for key in ("columns", "rows"):
+            if len(fingerprint[key]) != len(cached.get(key, "")):
+                return False
+            if sum(a != b for a, b in zip(fingerprint[key], cached[key])) > self.fingerprint_tolerance:
+                return False
+        return True
+
+    def load_layout_cache(self) -> list:
+        """讀取定位快取，檔案不存在或損毀時回傳空列表"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return []
+
+    def lookup_layout_cache(self, fingerprint:dict) -> dict:
+        """以螢幕指紋查詢定位快取，沒有命中時回傳 None"""
+        for entry in self.load_layout_cache():
+            if self.fingerprint_matches(fingerprint, entry.get("fingerprint", {})):
+                return entry["layout"]
+        return None
+
+    def store_layout_cache(self, fingerprint:dict, layout:dict) -> None:
+        """儲存定位結果，同一個螢幕只保留最新的一筆"""
+        try:
+            entries = [entry for entry in self.load_layout_cache()
+                       if entry.get("fingerprint", {}).get("screen") != fingerprint["screen"]]
+            entries.insert(0, {"fingerprint": fingerprint, "layout": layout})
+            write_json_atomic(self.cache_path, entries[:self.cache_max_entries])
+        except Exception as e:
+            logging.error("'store_layout_cache'方法錯誤，無法儲存定位快取：{}".format(e))
+
+    def clear_layout_cache(self) -> None:
+        """清除定位快取，下一次定位時會重新載入定位模型"""
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def add_config_listener(self, callback) -> None:
+        """註冊框框位置更新時的回呼函式
+
+        Args:
+            callback (callable): callback(object_name, positions)，positions 為 {框框 ID: [x0, y0, x1, y1]}
+        """
+        self.config_listeners.append(callback)
+
+    @staticmethod
+    def compute_positions(size, start_x, start_y, frame_width, frame_height) -> dict:
+        """計算網格中每個框框的位置
+
+        Returns:
+            dict: {框框 ID: [x0, y0, x1, y1]}
+        """
+        positions = {}
+        for i in range(size):
+            for j in range(size):
+                x0 = int(start_x + j * frame_width)
+                y0 = int(start_y + i * frame_height)
+                x1 = int(x0 + frame_width)
+                y1 = int(y0 + frame_height)
+                frame_id = (size*size+1)-(i * size + j + 1)
+                positions[str(frame_id)] = [x0, y0, x1, y1]
+        return positions
+
     def update_config(self, object_name, size, start_x, start_y, frame_width, frame_height,frame=None):
         """_summary_
 
@@ -68,28 +225,23 @@ class LocationManager:
         """
         try:
             # 更新配置文件
-            for i in range(size):
-                for j in range(size):
-                    x0 = int(start_x + j * frame_width)
-                    y0 = int(start_y + i * frame_height)
-                    x1 = int(x0 + frame_width)
-                    y1 = int(y0 + frame_height)
-
-                    #cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
-                    frame_id = (size*size+1)-(i * size + j + 1)
-                    frame_key = str(frame_id)
-                    #cv2.putText(frame, frame_key, (x0, y0), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-                    if object_name not in self.config:
-                        self.config[object_name] = {}
-                    self.config[object_name][frame_key] = self.config[object_name].get(frame_key, {})
-                    self.config[object_name][frame_key]["position"] = [x0, y0, x1, y1]
+            for frame_key, position in self.compute_positions(size, start_x, start_y, frame_width, frame_height).items():
+                #cv2.rectangle(frame, tuple(position[:2]), tuple(position[2:]), (0, 255, 0), 2)
+                #cv2.putText(frame, frame_key, tuple(position[:2]), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                if object_name not in self.config:
+                    self.config[object_name] = {}
+                self.config[object_name][frame_key] = self.config[object_name].get(frame_key, {})
+                self.config[object_name][frame_key]["position"] = position
             # 將更新後的配置寫回文件
             #cv2.imshow("副視窗", frame)
             #cv2.waitKey(0)
 
-            with open(self.config_path, 'w', encoding='utf-8') as config_file:
-                json.dump(self.config, config_file, indent=4, ensure_ascii=False)
+            # 其他模組可能同時讀取配置文件（例如啟動時平行初始化），以暫存檔取代避免讀到寫一半的內容
+            write_json_atomic(self.config_path, self.config)
+            # 通知框框位置已更新，例如讓 DetectionManager 重建覆蓋層
+            positions = {frame_key: frame_config["position"] for frame_key, frame_config in self.config[object_name].items()}
+            for callback in self.config_listeners:
+                callback(object_name, positions)
         except Exception as e:
             logging.error("'update_config'方法錯誤，無法更新配置：{}".format(e))
 
@@ -97,7 +249,7 @@ class LocationManager:
 if __name__=="__main__":
     monitor = MonitorManager("主視窗")
     locationManager = LocationManager("data/window_admin_settings.json", monitor)
-    locationManager.initialize_window_config()
+    locationManager.initialize_window_config(use_cache=False) # 強制重新定位
 # 使用示例
 # locationManager = LocationManager('path/to/config.json', monitor_instance)
 # locationManager.initialize_window_config()
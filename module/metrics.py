@@ -0,0 +1,279 @@
+# metrics.py
+# 用途：各階段的耗時與計數統計（直方圖、計數器、量測值），可透過本機 Prometheus 文字格式端點或定期寫出的 JSON 檔匯出
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('metrics', 'Metrics.log')
+
+METRIC_PREFIX = "monitor_detector_"
+# 直方圖的預設區間（秒），涵蓋 0.5 ms 的框框判斷到數秒的推論
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(labels:tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels) + "}"
+
+
+class Counter:
+    """只會增加的計數器"""
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount:float=1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def prometheus_lines(self, name:str, labels:tuple) -> list:
+        return ["{}{} {}".format(name, format_labels(labels), self.value)]
+
+
+class Gauge:
+    """目前的量測值，可以直接設定，或在匯出時呼叫 callback 取得（例如佇列深度）"""
+    kind = "gauge"
+
+    def __init__(self, callback=None):
+        self.value = 0.0
+        self.callback = callback
+
+    def set(self, value:float) -> None:
+        self.value = value
+
+    def snapshot(self):
+        if self.callback is not None:
+            try:
+                self.value = self.callback()
+            except Exception as e:
+                logging.error("'Gauge.snapshot'方法錯誤，無法取得量測值：{}".format(e))
+        return self.value
+
+    def prometheus_lines(self, name:str, labels:tuple) -> list:
+        return ["{}{} {}".format(name, format_labels(labels), self.snapshot())]
+
+
+class Histogram:
+    """耗時的直方圖，保留累計的區間計數供 Prometheus 使用，另外保留最近的樣本計算百分位數"""
+    kind = "histogram"
+
+    def __init__(self, buckets:tuple=DEFAULT_BUCKETS, window:int=1024):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1) # 最後一格為 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window) # 最近的樣本，用於百分位數
+        self.lock = threading.Lock()
+
+    def observe(self, value:float) -> None:
+        with self.lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.recent.append(value)
+
+    @contextmanager
+    def time(self):
+        """以 with 區塊量測耗時"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            recent = np.array(self.recent) if self.recent else None
+            count, total = self.count, self.sum
+        result = {"count": count, "sum": total, "mean": total / count if count else 0.0}
+        for percentile in (50, 90, 99):
+            result["p{}".format(percentile)] = float(np.percentile(recent, percentile)) if recent is not None else 0.0
+        return result
+
+    def prometheus_lines(self, name:str, labels:tuple) -> list:
+        with self.lock:
+            bucket_counts = list(self.bucket_counts)
+            count, total = self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+            cumulative += bucket_count
+            lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", bound),)), cumulative))
+        lines.append("{}_sum{} {}".format(name, format_labels(labels), total))
+        lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+        return lines
+
+
+class MetricsRegistry:
+    """所有統計的集合，以 (名稱, 標籤) 取得同一個統計，第一次使用時建立"""
+    def __init__(self, prefix:str=METRIC_PREFIX):
+        self.prefix = prefix
+        self.metrics = {} # {(名稱, 標籤): 統計}
+        self.help_texts = {} # {名稱: 說明}
+        self.lock = threading.Lock()
+
+    def get_or_create(self, factory, name:str, help_text:str, labels:dict, **kwargs):
+        key = (self.prefix + name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = factory(**kwargs)
+                    self.metrics[key] = metric
+                    if help_text:
+                        self.help_texts.setdefault(key[0], help_text)
+        return metric
+
+    def counter(self, name:str, help_text:str="", **labels) -> Counter:
+        return self.get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name:str, help_text:str="", callback=None, **labels) -> Gauge:
+        gauge = self.get_or_create(Gauge, name, help_text, labels)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name:str, help_text:str="", **labels) -> Histogram:
+        return self.get_or_create(Histogram, name, help_text, labels)
+
+    def stage(self, stage:str) -> Histogram:
+        """各處理階段的耗時直方圖"""
+        return self.histogram("stage_seconds", "各處理階段的耗時（秒）", stage=stage)
+
+    def snapshot(self) -> dict:
+        """所有統計的目前值，用於 JSON 匯出與狀態面板
+
+        Returns:
+            dict: {"timestamp", "metrics": {名稱{標籤}: 值}}
+        """
+        with self.lock:
+            items = list(self.metrics.items())
+        metrics = {}
+        for (name, labels), metric in sorted(items, key=lambda item: item[0]):
+            metrics[name[len(self.prefix):] + format_labels(labels)] = metric.snapshot()
+        return {"timestamp": time.time(), "metrics": metrics}
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文字格式"""
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: item[0])
+        lines = []
+        last_name = None
+        for (name, labels), metric in items:
+            if name != last_name:
+                if name in self.help_texts:
+                    lines.append("# HELP {} {}".format(name, self.help_texts[name]))
+                lines.append("# TYPE {} {}".format(name, metric.kind))
+                last_name = name
+            lines.extend(metric.prometheus_lines(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+# 全程式共用的統計集合
+REGISTRY = MetricsRegistry()
+
+
+class MetricsHTTPServer:
+    """本機的統計端點：/metrics 為 Prometheus 文字格式，/metrics.json 為 JSON"""
+    def __init__(self, registry:MetricsRegistry=REGISTRY, host:str="127.0.0.1", port:int=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self) -> bool:
+        """啟動端點，埠號被占用等錯誤時回傳 False"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body = json.dumps(registry.snapshot(), ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                elif self.path.startswith("/metrics"):
+                    body = registry.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # 不在終端機輸出每次請求
+                return None
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logging.error("'MetricsHTTPServer.start'方法錯誤，無法啟動統計端點 {}:{}：{}".format(self.host, self.port, e))
+            return False
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsHTTPServer", daemon=True)
+        self.thread.start()
+        logging.info("統計端點已啟動：http://{}:{}/metrics".format(self.host, self.server.server_address[1]))
+        return True
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class MetricsFileWriter:
+    """定期將統計寫成 JSON 檔，寫入暫存檔後再取代，讀取端不會讀到寫一半的檔案"""
+    def __init__(self, registry:MetricsRegistry=REGISTRY, path:str="log/metrics.json", interval:float=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def write(self) -> None:
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            json.dump(self.registry.snapshot(), metrics_file, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logging.error("'MetricsFileWriter.run'方法錯誤，無法寫出統計：{}".format(e))
+
+    def start(self) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="MetricsFileWriter", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
@@ -7,41 +7,163 @@ import sys
 import os
 # 將目錄切換至根目錄
 sys.path.append(os.path.join(os.path.dirname(__file__), '..')) 
+import time
+import threading
+from collections import deque
+import json
 import numpy as np
 import cv2
 import mss
 import mss.tools
 from utils.log import setup_logger
+from module.metrics import REGISTRY
 
 # 設置日誌處理器，支持指定編碼
 logging = setup_logger('monitor', 'MonitorManager.log')
 
 
 class MonitorManager:
-    def __init__(self,window_name:str):
+    def __init__(self,window_name:str, buffer_size:int=3, capture_fps:float=30, video_path:str="data\\test_video1.mp4"):
         self.window_name=window_name
         self.screen=None
         self.setup_monitor() #綁定特定螢幕
-        self.cap=cv2.VideoCapture("data\\test_video1.mp4") #暫時先用來測試用的屬性
+        self.video_path=video_path # temp_get_frame 使用的影片，None 表示不開啟影片
+        self.cap=cv2.VideoCapture(video_path) if video_path else None #暫時先用來測試用的屬性
+        # 背景擷取執行緒相關屬性
+        self.buffer_size=buffer_size # 環形緩衝區大小
+        self.capture_fps=capture_fps # 背景擷取的目標 FPS
+        self.frame_buffer=deque(maxlen=buffer_size) # 環形緩衝區，內容為 (序號, 時間戳, 影像)，新影像會擠掉最舊的影像
+        self.frame_lock=threading.Lock()
+        self.frame_event=threading.Event() # 有新影像時會被設置
+        self.frame_seq=0 # 影像序號，每擷取一張加一
+        self.capture_thread=None
+        self.capture_stop_event=threading.Event()
+        # 擷取區域相關屬性
+        self.output_size=(1280, 720) # 擷取整個螢幕時輸出的影像大小，也是配置文件 position 的座標系
+        self.capture_region=None # 只擷取網格範圍時的 mss 區域，None 表示擷取整個螢幕
+        self.region_transform=None # 配置座標轉換至區域影像座標的 (x0, y0, scale_x, scale_y)
+        self.sct_local=threading.local() # mss 不是執行緒安全的，每個執行緒保有自己的長駐 session
 
     def setup_monitor(self):
         """_summary_ 綁定特定螢幕
         """
         try:
             with mss.mss() as sct:
-                monitor_number = 1 if self.window_name == "主視窗" else 2  # 根據 window_name 選擇螢幕
+                monitor_number = self.get_monitor_number(self.window_name)  # 根據 window_name 選擇螢幕
                 self.screen = sct.monitors[monitor_number]  # 獲取特定編號的螢幕
         except Exception as e:
             logging.error("'boundle_monitor'方法錯誤，無法找到特定螢幕：{}".format(e))
         
     
+    @staticmethod
+    def get_monitor_number(window_name) -> int:
+        """將螢幕名稱轉換為 mss 的螢幕編號
+
+        Args:
+            window_name (str | int): "主視窗"、"副視窗"、"螢幕N" 或螢幕編號
+
+        Returns:
+            int: mss 的螢幕編號（1 開始）
+        """
+        if isinstance(window_name, int):
+            return window_name
+        if window_name == "主視窗":
+            return 1
+        if window_name == "副視窗":
+            return 2
+        if window_name.startswith("螢幕") and window_name[2:].isdigit():
+            return int(window_name[2:])
+        return int(window_name)
+
+    @staticmethod
+    def list_monitor_names() -> list:
+        """列出所有螢幕的名稱，格式為「螢幕N」"""
+        with mss.mss() as sct:
+            return ["螢幕{}".format(index) for index in range(1, len(sct.monitors))]
+
     def temp_get_frame(self):
         #暫時先用來測試用的方法
+        if self.cap is None:
+            return None
         ret,img=self.cap.read()
+        if not ret:
+            return None
         img=cv2.resize(img,(1280,720))
         return img
 
 
+    def start_capture(self, grab=None) -> None:
+        """啟動背景擷取執行緒，持續將最新影像放入環形緩衝區
+
+        Args:
+            grab (callable, optional): 擷取一張影像的函式，預設為 capture_frame
+        """
+        if self.capture_thread is not None and self.capture_thread.is_alive():
+            return
+        grab = grab if grab is not None else self.capture_frame
+        self.capture_stop_event.clear()
+        with self.frame_lock:
+            self.frame_buffer.clear()
+        self.frame_event.clear()
+        self.capture_thread = threading.Thread(target=self._capture_loop, args=(grab,),
+                                               name="MonitorCapture", daemon=True)
+        self.capture_thread.start()
+
+    def stop_capture(self, timeout:float=1.0) -> None:
+        """停止背景擷取執行緒"""
+        self.capture_stop_event.set()
+        if self.capture_thread is not None:
+            self.capture_thread.join(timeout)
+            self.capture_thread = None
+
+    def _capture_loop(self, grab) -> None:
+        """背景擷取迴圈，依照 capture_fps 擷取影像並放入環形緩衝區"""
+        interval = 1.0 / self.capture_fps if self.capture_fps else 0
+        capture_stage = REGISTRY.stage("capture")
+        captured_frames = REGISTRY.counter("frames_captured_total", "擷取的影像數", monitor=self.window_name)
+        while not self.capture_stop_event.is_set():
+            start = time.monotonic()
+            try:
+                with capture_stage.time():
+                    frame = grab()
+            except Exception as e:
+                logging.error("'_capture_loop'方法錯誤，無法擷取影像：{}".format(e))
+                frame = None
+            if frame is not None:
+                captured_frames.inc()
+                with self.frame_lock:
+                    self.frame_seq += 1
+                    self.frame_buffer.append((self.frame_seq, time.monotonic(), frame))
+                self.frame_event.set()
+            # 控制擷取速度，避免空轉佔用 CPU
+            remaining = interval - (time.monotonic() - start)
+            if remaining > 0:
+                self.capture_stop_event.wait(remaining)
+        self.close_session() # 執行緒結束前釋放該執行緒的 mss session
+
+    def get_latest_frame(self, last_seq:int=None, timeout:float=None):
+        """取得環形緩衝區中最新的影像，不會等待擷取
+
+        Args:
+            last_seq (int, optional): 上一次取得的影像序號，若最新影像序號相同則等待新影像
+            timeout (float, optional): 等待新影像的最長秒數，None 表示不等待
+
+        Returns:
+            tuple: (序號, 時間戳, 影像)，沒有影像時回傳 None
+        """
+        with self.frame_lock:
+            latest = self.frame_buffer[-1] if self.frame_buffer else None
+            if latest is None or latest[0] == last_seq:
+                self.frame_event.clear()
+                latest = None
+        if latest is None and timeout:
+            if self.frame_event.wait(timeout):
+                with self.frame_lock:
+                    latest = self.frame_buffer[-1] if self.frame_buffer else None
+                if latest is not None and latest[0] == last_seq:
+                    latest = None
+        return latest
+
     def display_monitors_info(self):
         """_summary_ 
         用mss來顯示所有螢幕的資訊
@@ -50,26 +172,102 @@ class MonitorManager:
             for index, monitor in enumerate(sct.monitors):
                 print("螢幕編號：{}，螢幕資訊：{}".format(index, monitor))
 
-    def capture_frame(self):
-        """擷取螢幕畫面，並將 mss 的截圖轉換為 NumPy 數組
+    def get_session(self):
+        """取得目前執行緒的長駐 mss session，第一次呼叫時建立
+
         Returns:
-            cv2.ndarray: 擷取到的螢幕畫面
+            mss.base.MSSBase: mss 擷取 session
+        """
+        sct = getattr(self.sct_local, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            self.sct_local.sct = sct
+        return sct
+
+    def close_session(self) -> None:
+        """關閉目前執行緒的 mss session"""
+        sct = getattr(self.sct_local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self.sct_local.sct = None
+
+    def set_capture_region(self, config_path:str, window_layout_str:str) -> None:
+        """依照配置文件中所有 position 的聯集，設定只擷取網格範圍（原生解析度）
+
+        Args:
+            config_path (str): 配置文件路徑
+            window_layout_str (str): 視窗佈局，例如 "4x4"
         """
         try:
-            with mss.mss() as sct:
-                # 捕獲螢幕畫面
-                screenshot = sct.grab(self.screen)
+            with open(config_path, "r", encoding="utf-8") as config_file:
+                window_config = json.load(config_file)
+            positions = np.array([location["position"] for location in window_config[window_layout_str].values()])
+            x0, y0 = positions[:, 0].min(), positions[:, 1].min()
+            x1, y1 = positions[:, 2].max(), positions[:, 3].max()
+            # 配置座標是以 output_size 為基準，換算回螢幕的原生解析度
+            scale_x = self.screen["width"] / self.output_size[0]
+            scale_y = self.screen["height"] / self.output_size[1]
+            self.capture_region = {
+                "left": self.screen["left"] + int(x0 * scale_x),
+                "top": self.screen["top"] + int(y0 * scale_y),
+                "width": max(1, int(round((x1 - x0) * scale_x))),
+                "height": max(1, int(round((y1 - y0) * scale_y))),
+            }
+            self.region_transform = (int(x0), int(y0), scale_x, scale_y)
+        except Exception as e:
+            self.clear_capture_region()
+            logging.error("'set_capture_region'方法錯誤，無法設定擷取區域：{}".format(e))
+
+    def clear_capture_region(self) -> None:
+        """取消網格範圍擷取，恢復擷取整個螢幕"""
+        self.capture_region = None
+        self.region_transform = None
+
+    def map_config_boxes(self, boxes:dict) -> dict:
+        """將配置座標系的框框轉換為目前擷取影像的座標系
+
+        Args:
+            boxes (dict): {框框 ID: [x0, y0, x1, y1]}，配置文件的座標
+
+        Returns:
+            dict: {框框 ID: np.array([x0, y0, x1, y1])}，擷取影像的座標
+        """
+        if self.region_transform is None:
+            return {location_id: np.array(box) for location_id, box in boxes.items()}
+        offset_x, offset_y, scale_x, scale_y = self.region_transform
+        mapped = {}
+        for location_id, box in boxes.items():
+            x0, y0, x1, y1 = box
+            mapped[location_id] = np.array([int((x0 - offset_x) * scale_x), int((y0 - offset_y) * scale_y),
+                                            int((x1 - offset_x) * scale_x), int((y1 - offset_y) * scale_y)])
+        return mapped
+
+    def capture_frame(self, use_region:bool=True):
+        """擷取螢幕畫面，並將 mss 的截圖轉換為 NumPy 數組。
+        有設定擷取區域時只擷取網格範圍並保留原生解析度，否則擷取整個螢幕並縮放為 output_size
 
-                # 將捕獲的數據轉換為 NumPy 數組
-                frame = np.array(screenshot, dtype=np.uint8)
-                frame = frame[:, :, :3]  # 去除 alpha 通道
-                frame = cv2.resize(frame, (1280, 720))  # 將螢幕調整為 1280x720
+        Args:
+            use_region (bool): 是否使用 set_capture_region 設定的擷取區域
+
+        Returns:
+            cv2.ndarray: 擷取到的螢幕畫面
+        """
+        try:
+            sct = self.get_session()
+            region = self.capture_region if use_region and self.capture_region is not None else None
+            # 捕獲螢幕畫面
+            screenshot = sct.grab(region if region is not None else self.screen)
+            # 直接包裝 mss 的緩衝區，不額外複製
+            bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+            if region is None:
+                bgra = cv2.resize(bgra, self.output_size)  # 將螢幕調整為 1280x720
+            frame = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)  # 去除 alpha 通道，同時產生連續的影像
         except Exception as e:
             logging.error(" 'capture_frame' 方法錯誤：{}".format(e))
             return None
         # 返回影像
         return frame
-    
+
 
 if __name__ == "__main__":
     monitor = MonitorManager("主視窗")
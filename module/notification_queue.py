@@ -0,0 +1,142 @@
+# notification_queue.py
+# 用途：有上限的通知佇列，佇列滿時依照策略丟棄或等待，並統計排入、丟棄、發送、失敗的數量
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import queue
+import threading
+from collections import deque
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('notification_queue', 'NotificationQueue.log')
+
+
+class NotificationQueue:
+    """有上限的通知佇列，介面與 queue.Queue 的 put / get / task_done 相容。
+    佇列滿時的策略：
+        "drop_oldest"：丟棄最舊的通知
+        "drop_duplicate"：優先丟棄與新通知同一視窗的最舊通知，其次丟棄最舊、且同一視窗還有較新通知的項目，
+                          每個視窗至少保留最新一則；都不重複時丟棄最舊的通知
+        "block"：等待 block_timeout 秒，仍然滿時丟棄新的通知
+    """
+    POLICIES = ("drop_oldest", "drop_duplicate", "block")
+
+    def __init__(self, maxsize:int=64, policy:str="drop_oldest", block_timeout:float=1.0):
+        if policy not in self.POLICIES:
+            raise ValueError("未知的佇列策略：{}".format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.items = deque() # [(排入時間, 通知)]
+        self.condition = threading.Condition()
+        # 統計數量
+        self.enqueued = 0 # 排入的通知數
+        self.dropped = 0 # 被丟棄的通知數
+        self.sent = 0 # 發送成功的訊息數（合併後的訊息）
+        self.failed = 0 # 發送失敗的訊息數
+
+    def qsize(self) -> int:
+        with self.condition:
+            return len(self.items)
+
+    def put(self, item, block:bool=True, timeout:float=None) -> bool:
+        """排入一則通知，佇列滿時依照策略處理
+
+        Returns:
+            bool: 是否成功排入
+        """
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.policy == "block":
+                    wait_timeout = timeout if timeout is not None else self.block_timeout
+                    if not block or not self.condition.wait_for(lambda: len(self.items) < self.maxsize, wait_timeout):
+                        self.dropped += 1
+                        logging.warning("通知佇列已滿，丟棄視窗 {} 的通知".format(item.get("window_id")))
+                        return False
+                else:
+                    self.evict(item)
+            self.items.append((time.monotonic(), item))
+            self.enqueued += 1
+            self.condition.notify_all()
+            return True
+
+    def evict(self, new_item:dict) -> None:
+        """依照策略丟棄一則通知（呼叫時需持有鎖）
+
+        Args:
+            new_item (dict): 即將排入的通知
+        """
+        index = 0
+        if self.policy == "drop_duplicate":
+            # 新通知的視窗已經有排隊中的通知時，丟棄該視窗最舊的一則，不影響其他視窗
+            new_window_id = new_item.get("window_id")
+            for position, (_, queued_item) in enumerate(self.items):
+                if queued_item.get("window_id") == new_window_id:
+                    self._drop(position)
+                    return
+            # 從最新往最舊找，已經看過的視窗表示有更新的通知，最舊的重複項目優先丟棄
+            seen_windows = set()
+            duplicates = []
+            for position in range(len(self.items) - 1, -1, -1):
+                window_id = self.items[position][1].get("window_id")
+                if window_id in seen_windows:
+                    duplicates.append(position)
+                seen_windows.add(window_id)
+            if duplicates:
+                index = duplicates[-1]
+        self._drop(index)
+
+    def _drop(self, index:int) -> None:
+        """丟棄佇列中第 index 則通知（呼叫時需持有鎖）"""
+        _, dropped_item = self.items[index]
+        del self.items[index]
+        self.dropped += 1
+        logging.warning("通知佇列已滿，丟棄視窗 {} 的通知".format(dropped_item.get("window_id")))
+
+    def get(self, block:bool=True, timeout:float=None):
+        """取出最舊的通知，沒有通知時拋出 queue.Empty"""
+        with self.condition:
+            if not block:
+                if not self.items:
+                    raise queue.Empty
+            elif not self.condition.wait_for(lambda: len(self.items) > 0, timeout):
+                raise queue.Empty
+            _, item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def task_done(self) -> None:
+        """與 queue.Queue 相容，不需要額外處理"""
+        return None
+
+    def mark_result(self, success:bool) -> None:
+        """記錄一則訊息的發送結果"""
+        with self.condition:
+            if success:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def oldest_age(self) -> float:
+        """最舊通知在佇列中等待的秒數，佇列為空時為 0"""
+        with self.condition:
+            if not self.items:
+                return 0.0
+            return time.monotonic() - self.items[0][0]
+
+    def stats(self) -> dict:
+        """取得佇列統計資料"""
+        with self.condition:
+            return {
+                "depth": len(self.items),
+                "maxsize": self.maxsize,
+                "oldest_age": time.monotonic() - self.items[0][0] if self.items else 0.0,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "sent": self.sent,
+                "failed": self.failed,
+            }
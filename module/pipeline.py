@@ -0,0 +1,285 @@
+# pipeline.py
+# 用途：多螢幕管線，每個螢幕在獨立的子行程中執行 擷取 + 偵測，結果送回主行程統一通知與顯示。
+# 主視窗（main.py）依照 data/pipelines.json 為其他螢幕啟動管線，通知排入同一個通知佇列，預覽並排顯示
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import json
+import queue
+import multiprocessing
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('pipeline', 'PipelineManager.log')
+
+PIPELINE_REQUIRED_KEYS = ("monitor_name", "config_path", "window_layout_str")
+
+
+def load_pipeline_configs(path:str="data/pipelines.json") -> list:
+    """讀取其他螢幕的管線設定，檔案不存在時回傳空列表
+
+    檔案格式為列表，每一項是 MultiMonitorPipeline.add_monitor 的參數，例如：
+    [{"monitor_name": "螢幕3", "config_path": "data/window_admin_settings_3.json", "window_layout_str": "4x4", "num_threads": 2}]
+
+    Args:
+        path (str): 設定檔路徑
+
+    Returns:
+        list: [{add_monitor 的參數}, ...]，缺少必要欄位的設定會被略過
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as config_file:
+            pipeline_configs = json.load(config_file)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logging.error("'load_pipeline_configs'方法錯誤，無法讀取 {}：{}".format(path, e))
+        return []
+    valid_configs = []
+    for pipeline_config in pipeline_configs:
+        missing = [key for key in PIPELINE_REQUIRED_KEYS if key not in pipeline_config]
+        if missing:
+            logging.error("'load_pipeline_configs'方法錯誤，管線設定缺少 {}：{}".format(", ".join(missing), pipeline_config))
+            continue
+        pipeline_config.setdefault("vehicle_detect_model_path", None) # 依照佈局選擇模型
+        valid_configs.append(pipeline_config)
+    return valid_configs
+
+
+def build_notifications(message:dict) -> list:
+    """將管線結果轉為通知佇列的通知。視窗 ID 與 frame_key 都帶有螢幕名稱，
+    不同螢幕相同的視窗 ID 與影像序號不會互相覆蓋（NotificationRouter 依照螢幕名稱分派，SnapshotEncoder 的快取也不會混用）
+
+    Args:
+        message (dict): get_result() 回傳的管線結果
+
+    Returns:
+        list: [{"window_id", "vehicle", "image", "frame_key", "message"}, ...]
+    """
+    monitor_name = message["monitor_name"]
+    return [{
+        "window_id": (monitor_name, frame_id),
+        "vehicle": vehicle,
+        "image": message["frame"],
+        "frame_key": (monitor_name, message["seq"]),
+        "message": "{} 發現車輛".format(monitor_name),
+    } for frame_id, vehicle in message["results"]]
+
+
+def run_monitor_pipeline(pipeline_config:dict, result_queue, stop_event) -> None:
+    """子行程的進入點，建立自己的 MonitorManager 與 DetectionManager（含獨立的追蹤器狀態），
+    持續擷取並偵測，將結果放入 result_queue
+
+    Args:
+        pipeline_config (dict): 管線設定，欄位見 MultiMonitorPipeline.add_monitor
+        result_queue (multiprocessing.Queue): 回傳結果的佇列
+        stop_event (multiprocessing.Event): 停止事件
+    """
+    monitor_name = pipeline_config["monitor_name"]
+    try:
+        # 在子行程中才載入偵測模組，避免主行程重複載入模型
+        from module.monitor import MonitorManager
+        from module.detection import DetectionManager
+        if pipeline_config.get("num_threads"):
+            import torch
+            torch.set_num_threads(pipeline_config["num_threads"]) # 避免多個行程搶同一批 CPU 核心
+        monitor = MonitorManager(window_name=monitor_name)
+        detection = DetectionManager(vehicle_detect_model_path=pipeline_config["vehicle_detect_model_path"],
+                                     config_path=pipeline_config["config_path"],
+                                     window_layout_str=pipeline_config["window_layout_str"],
+                                     backend=pipeline_config.get("backend", "torch"),
+                                     backend_options=pipeline_config.get("backend_options"))
+        detection.set_inference_mode(pipeline_config.get("inference_mode", "mosaic"))
+        if pipeline_config.get("event_store_path"):
+            from module.event_store import EventStore
+            detection.event_store = EventStore(pipeline_config["event_store_path"], layout=pipeline_config["window_layout_str"])
+        grab = monitor.temp_get_frame if pipeline_config.get("source") == "video" else monitor.capture_frame
+        monitor.start_capture(grab=grab)
+    except Exception as e:
+        logging.error("'run_monitor_pipeline'方法錯誤，{} 管線初始化失敗：{}".format(monitor_name, e))
+        result_queue.put({"monitor_name": monitor_name, "error": str(e)})
+        return
+
+    display_interval = pipeline_config.get("display_interval", 0.2)
+    last_display = 0
+    last_seq = None
+    try:
+        while not stop_event.is_set():
+            packet = monitor.get_latest_frame(last_seq=last_seq, timeout=0.5)
+            if packet is None:
+                continue
+            last_seq, timestamp, frame = packet
+            detected = detection.detect(frame, frame_key=last_seq)
+            if detected is None:
+                continue
+            results, anno_frame = detected
+            now = time.monotonic()
+            send_display = now - last_display >= display_interval
+            if not results and not send_display:
+                continue
+            message = {
+                "monitor_name": monitor_name,
+                "seq": last_seq,
+                "timestamp": timestamp,
+                "results": results,
+                "frame": frame if results else None, # 有車輛時附上原始影像供通知使用
+                "anno_frame": anno_frame.render() if send_display else None, # 只有要顯示時才繪製標註影像
+            }
+            if results:
+                # 通知不可遺失，佇列滿時等待
+                result_queue.put(message)
+            else:
+                # 純顯示用的影像可以丟棄，避免主行程跟不上時堆積
+                try:
+                    result_queue.put_nowait(message)
+                except queue.Full:
+                    continue
+            if send_display:
+                last_display = now
+    except Exception as e:
+        logging.error("'run_monitor_pipeline'方法錯誤，{} 管線執行失敗：{}".format(monitor_name, e))
+        result_queue.put({"monitor_name": monitor_name, "error": str(e)})
+    finally:
+        monitor.stop_capture()
+        if detection.event_store is not None:
+            detection.record_live_tracks() # 仍在畫面中的車輛記錄最後出現時間
+            detection.event_store.close()
+
+
+class MultiMonitorPipeline:
+    """每個螢幕一個子行程的 擷取 + 偵測 管線，所有結果匯集到同一個佇列，
+    由主行程負責通知與顯示，可以使用多個 CPU 核心而不受 GIL 限制
+    """
+    def __init__(self, queue_size:int=32):
+        self.queue_size = queue_size
+        self.pipeline_configs = []
+        self.context = multiprocessing.get_context("spawn") # Windows 只支援 spawn，統一使用以確保行為一致
+        self.result_queue = None
+        self.stop_event = None
+        self.processes = []
+
+    def add_monitor(self, monitor_name, config_path:str, window_layout_str:str, vehicle_detect_model_path:str,
+                    inference_mode:str="mosaic", source:str="screen", num_threads:int=None, display_interval:float=0.2,
+                    backend:str="torch", backend_options:dict=None, event_store_path:str=None) -> None:
+        """新增一個螢幕的管線設定
+
+        Args:
+            monitor_name (str | int): 螢幕名稱，例如 "主視窗"、"螢幕3"
+            config_path (str): 該螢幕的配置文件路徑，不同螢幕的視窗 ID 各自獨立
+            window_layout_str (str): 視窗佈局，例如 "4x4"
+            vehicle_detect_model_path (str): 車輛偵測模型路徑，None 表示依照佈局選擇
+            inference_mode (str): "mosaic" 或 "tiles"
+            source (str): "screen" 擷取螢幕，"video" 使用測試影片
+            num_threads (int, optional): 子行程中 torch 使用的執行緒數
+            display_interval (float): 傳回顯示影像的最短間隔秒數
+            backend (str): 推論後端，"torch" 或 "onnx"
+            backend_options (dict, optional): 推論後端的設定，例如 {"num_threads": 2}
+            event_store_path (str, optional): 偵測事件資料庫路徑，多個子行程可以共用同一個資料庫
+        """
+        self.pipeline_configs.append({
+            "monitor_name": monitor_name,
+            "config_path": config_path,
+            "window_layout_str": window_layout_str,
+            "vehicle_detect_model_path": vehicle_detect_model_path,
+            "inference_mode": inference_mode,
+            "source": source,
+            "num_threads": num_threads,
+            "display_interval": display_interval,
+            "backend": backend,
+            "backend_options": backend_options,
+            "event_store_path": event_store_path,
+        })
+
+    def start(self) -> None:
+        """為每個螢幕啟動一個子行程"""
+        if self.processes:
+            return
+        self.result_queue = self.context.Queue(maxsize=self.queue_size)
+        self.stop_event = self.context.Event()
+        for pipeline_config in self.pipeline_configs:
+            process = self.context.Process(target=run_monitor_pipeline,
+                                           args=(pipeline_config, self.result_queue, self.stop_event),
+                                           name="Pipeline-{}".format(pipeline_config["monitor_name"]),
+                                           daemon=True)
+            process.start()
+            self.processes.append(process)
+            logging.info("已啟動 {} 的管線，PID：{}".format(pipeline_config["monitor_name"], process.pid))
+
+    def get_result(self, timeout:float=None):
+        """取得任一螢幕管線的結果
+
+        Args:
+            timeout (float, optional): 等待秒數，None 表示一直等待
+
+        Returns:
+            dict: 管線結果，格式見 run_monitor_pipeline，逾時回傳 None
+        """
+        try:
+            return self.result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self, timeout:float=5.0) -> None:
+        """停止所有子行程
+
+        Args:
+            timeout (float): 等待子行程自行結束的秒數，逾時則強制終止
+        """
+        if self.stop_event is not None:
+            self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        # 清空佇列，避免子行程卡在 put 而無法結束
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            try:
+                self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=1)
+        self.processes = []
+
+
+if __name__ == "__main__":
+    import cv2
+    from module.communication import NotificationManager, NotificationRouter, AlertCoalescer
+    from module.notification_queue import NotificationQueue
+
+    pipeline = MultiMonitorPipeline()
+    pipeline.add_monitor("主視窗", "data/window_admin_settings.json", "4x4", None) # 模型依照佈局選擇
+    pipeline.add_monitor("副視窗", "data/window_admin_settings_2.json", "4x4", None)
+    # 每個螢幕使用自己的配置文件，通知經過同一個佇列與合併器，由各螢幕的 NotificationManager 執行緒池發送
+    managers = {pipeline_config["monitor_name"]: NotificationManager(config_path=pipeline_config["config_path"],
+                                                                     window_layout_str=pipeline_config["window_layout_str"])
+                for pipeline_config in pipeline.pipeline_configs}
+    router = NotificationRouter(managers["主視窗"], managers)
+    notification_queue = NotificationQueue(maxsize=64, policy="drop_oldest")
+    coalescer = AlertCoalescer(router, on_result=notification_queue.mark_result)
+    pipeline.start()
+    try:
+        while True:
+            message = pipeline.get_result(timeout=0.1)
+            if message is not None and "error" not in message:
+                for notification_data in build_notifications(message):
+                    print("{} 偵測到車輛，落於：{}號框，車輛 ID：{}".format(message["monitor_name"], notification_data["window_id"][1],
+                                                                 notification_data["vehicle"].vehicle_id))
+                    notification_queue.put(notification_data)
+                if message["anno_frame"] is not None:
+                    cv2.imshow(str(message["monitor_name"]), message["anno_frame"])
+            while True: # 範例在同一個迴圈中取出通知，主視窗由 NotificationThread 負責
+                try:
+                    coalescer.add(notification_queue.get(block=False))
+                except queue.Empty:
+                    break
+            coalescer.flush_due()
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        pipeline.stop()
+        coalescer.flush_due(force=True)
+        router.close()
+        cv2.destroyAllWindows()
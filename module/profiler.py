@@ -0,0 +1,132 @@
+# profiler.py
+# 用途：執行中的取樣分析器，定期讀取所有執行緒的呼叫堆疊（sys._current_frames），
+# 輸出 collapsed stack 格式（flamegraph.pl、speedscope 可以直接讀取），停止時沒有任何額外負擔
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import threading
+import time
+from collections import Counter
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('profiler', 'Profiler.log')
+
+
+def frame_label(frame) -> str:
+    """堆疊中一層的名稱：函式 (檔名:函式起始行)，以函式為單位合併不同行的樣本"""
+    code = frame.f_code
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno).replace(";", ":")
+
+
+class SamplingProfiler:
+    """在背景執行緒中每 interval 秒取樣一次所有執行緒的堆疊，統計相同堆疊出現的次數。
+    沒有在分析時不存在取樣執行緒，也不設定 sys.setprofile，不影響偵測效能
+    """
+    def __init__(self, interval:float=0.005, output_dir:str="log", max_depth:int=64):
+        """
+        Args:
+            interval (float): 取樣間隔秒數
+            output_dir (str): 輸出檔案的資料夾
+            max_depth (int): 每個堆疊最多保留的層數（保留最內層，被截斷的外層以 "..." 表示）
+        """
+        self.interval = interval
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.stacks = Counter() # {"執行緒;外層;...;內層": 樣本數}
+        self.samples = 0
+        self.started_at = None
+        self.duration = None
+        self.output_path = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration:float=None) -> bool:
+        """開始取樣，duration 秒後自動停止並寫出檔案；已經在取樣時回傳 False"""
+        with self.lock:
+            if self.running:
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.duration = duration
+            self.output_path = None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name="SamplingProfiler", daemon=True)
+            self.thread.start()
+        logging.info("開始取樣分析，間隔 {} 秒，時間 {} 秒".format(self.interval, duration))
+        return True
+
+    def stop(self) -> str:
+        """停止取樣並等待檔案寫出
+
+        Returns:
+            str: 輸出檔案路徑，沒有取樣過時為 None
+        """
+        self.stop_event.set()
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return self.output_path
+
+    def run(self) -> None:
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.duration if self.duration else None
+        try:
+            while not self.stop_event.wait(self.interval):
+                self.sample(own_ident)
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        except Exception as e:
+            logging.error("'SamplingProfiler.run'方法錯誤，取樣中斷：{}".format(e))
+        finally:
+            try:
+                self.output_path = self.write()
+            except Exception as e:
+                logging.error("'SamplingProfiler.run'方法錯誤，無法寫出分析結果：{}".format(e))
+
+    def sample(self, own_ident:int) -> None:
+        """取樣一次所有執行緒（取樣執行緒本身除外）的堆疊"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            if len(stack) > self.max_depth:
+                # 耗時的函式在最內層，截斷外層並以 "..." 標示，同一個函式的樣本仍會合併在一起
+                stack = ["..."] + stack[-self.max_depth:]
+            thread_name = names.get(ident, "Thread-{}".format(ident)).replace(";", ":").replace(" ", "_")
+            self.stacks[";".join([thread_name] + stack)] += 1
+        self.samples += 1
+
+    def write(self) -> str:
+        """寫出 collapsed stack 檔案，每行為 "執行緒;外層;...;內層 樣本數"
+
+        Returns:
+            str: 輸出檔案路徑
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, "profile_{}.folded".format(time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))))
+        with open(path, "w", encoding="utf-8") as output_file:
+            for stack, count in self.stacks.most_common():
+                output_file.write("{} {}\n".format(stack, count))
+        logging.info("取樣分析完成，共 {} 次取樣，已寫出 {}".format(self.samples, path))
+        return path
+
+    def summary(self, top:int=10) -> list:
+        """樣本數最多的最內層函式，[(函式, 樣本數), ...]"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(top)
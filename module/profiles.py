@@ -0,0 +1,179 @@
+# profiles.py
+# 用途：依照視窗佈局選擇車輛偵測模型與輸入大小，並可在啟動時量測延遲，自動選擇這台電腦跑得動的最大設定，
+# 量測結果依照電腦與佈局快取，之後啟動時直接沿用
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import json
+import platform
+import numpy as np
+from module.backend import create_backend, OnnxBackend
+from module.location import write_json_atomic
+from utils.log import setup_logger
+
+# 設置日誌處理器，支持指定編碼
+logging = setup_logger('profiles', 'Profiles.log')
+
+# 每種佈局可自動調整的設定，由最準確（最慢）排到最快，只在 auto_tune 時使用
+# 格子越多，每格的車輛在拼接畫面中越小，需要較大的輸入大小；tile_imgsz 為 "tiles" 模式每格的輸入大小
+LAYOUT_PROFILES = {
+    "2x2": [
+        {"weights": "yolov8l.pt", "imgsz": 640, "tile_imgsz": 640},
+        {"weights": "yolov8m.pt", "imgsz": 640, "tile_imgsz": 480},
+        {"weights": "yolov8s.pt", "imgsz": 640, "tile_imgsz": 320},
+        {"weights": "yolov8n.pt", "imgsz": 480, "tile_imgsz": 320},
+    ],
+    "3x3": [
+        {"weights": "yolov8l.pt", "imgsz": 960, "tile_imgsz": 416},
+        {"weights": "yolov8m.pt", "imgsz": 960, "tile_imgsz": 416},
+        {"weights": "yolov8m.pt", "imgsz": 640, "tile_imgsz": 320},
+        {"weights": "yolov8s.pt", "imgsz": 640, "tile_imgsz": 320},
+    ],
+    "4x4": [
+        {"weights": "yolov8l.pt", "imgsz": 1280, "tile_imgsz": 320},
+        {"weights": "yolov8m.pt", "imgsz": 1280, "tile_imgsz": 320},
+        {"weights": "yolov8m.pt", "imgsz": 960, "tile_imgsz": 320},
+        {"weights": "yolov8s.pt", "imgsz": 960, "tile_imgsz": 256},
+        {"weights": "yolov8s.pt", "imgsz": 640, "tile_imgsz": 256},
+    ],
+}
+DEFAULT_PROFILES = [{"weights": "yolov8l.pt", "imgsz": 640, "tile_imgsz": 320}] # 表中沒有的佈局
+# 不自動調整時的預設設定：與原本相同的 yolov8l 與 640 輸入大小，避免只有 CPU 的電腦變慢；
+# 需要較大的輸入大小時開啟 auto_tune，由量測結果決定
+LAYOUT_DEFAULTS = {
+    "2x2": {"weights": "yolov8l.pt", "imgsz": 640, "tile_imgsz": 640},
+    "3x3": {"weights": "yolov8l.pt", "imgsz": 640, "tile_imgsz": 416},
+    "4x4": {"weights": "yolov8l.pt", "imgsz": 640, "tile_imgsz": 320},
+}
+AUTOTUNE_CACHE_PATH = "data/autotune_cache.json" # 自動調整結果的快取
+
+
+def layout_profiles(window_layout_str:str) -> list:
+    """取得佈局的設定列表，由最準確排到最快"""
+    return LAYOUT_PROFILES.get(window_layout_str, DEFAULT_PROFILES)
+
+
+def select_profile(window_layout_str:str, vehicle_detect_model_path:str=None) -> dict:
+    """選擇佈局的預設設定（不自動調整時）
+
+    Args:
+        window_layout_str (str): 視窗佈局，例如 "4x4"
+        vehicle_detect_model_path (str, optional): 指定的模型路徑，None 表示使用預設的模型
+
+    Returns:
+        dict: {"weights", "imgsz", "tile_imgsz"}
+    """
+    default = LAYOUT_DEFAULTS.get(window_layout_str, DEFAULT_PROFILES[0])
+    if not vehicle_detect_model_path:
+        return dict(default)
+    # 指定模型時沿用預設的輸入大小
+    return dict(default, weights=vehicle_detect_model_path)
+
+
+def build_backend(profile:dict, backend:str="torch", backend_options:dict=None):
+    """依照設定建立推論後端，ONNX 模型以設定的輸入大小匯出"""
+    options = dict(backend_options or {})
+    if backend == OnnxBackend.name:
+        options.setdefault("imgsz", profile["imgsz"])
+    return create_backend(backend, profile["weights"], **options)
+
+
+def measure_latency(model, imgsz:int, frame_shape:tuple=(720, 1280, 3), warmup:int=2, runs:int=5) -> float:
+    """以隨機影像量測一次推論的延遲，只呼叫 predict，不影響追蹤器狀態
+
+    Returns:
+        float: 延遲秒數的中位數
+    """
+    frame = np.random.default_rng(0).integers(0, 255, frame_shape, dtype=np.uint8)
+    latencies = []
+    for index in range(warmup + runs):
+        start = time.perf_counter()
+        model.predict(frame, imgsz=imgsz, verbose=False)
+        if index >= warmup: # 暖機的結果包含初始化時間，不列入計算
+            latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies))
+
+
+def autotune_cache_key(window_layout_str:str, target_fps:float, backend:str="torch", backend_options:dict=None) -> str:
+    """自動調整結果的快取鍵：電腦（名稱、CPU、核心數）、佈局、目標 FPS 與推論後端的設定"""
+    machine = "{}/{}/{}/{}".format(platform.node(), platform.machine(), platform.processor(), os.cpu_count())
+    options = json.dumps(backend_options or {}, sort_keys=True)
+    return "{}|{}|{:g}|{}|{}".format(machine, window_layout_str, target_fps, backend, options)
+
+
+def load_autotune_cache(cache_path:str=AUTOTUNE_CACHE_PATH) -> dict:
+    """讀取自動調整快取，檔案不存在或損毀時回傳空字典"""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def lookup_autotune_cache(key:str, window_layout_str:str, cache_path:str=AUTOTUNE_CACHE_PATH) -> dict:
+    """查詢自動調整快取，設定已經不在佈局的設定列表中時視為沒有命中
+
+    Returns:
+        dict: {"profile", "measurements"}，沒有命中時回傳 None
+    """
+    entry = load_autotune_cache(cache_path).get(key)
+    if entry is None or entry.get("profile") not in layout_profiles(window_layout_str):
+        return None
+    return entry
+
+
+def store_autotune_cache(key:str, profile:dict, measurements:dict, cache_path:str=AUTOTUNE_CACHE_PATH) -> None:
+    """儲存自動調整結果，同一個快取鍵只保留最新的一筆"""
+    try:
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        entries = load_autotune_cache(cache_path)
+        entries[key] = {"profile": profile, "measurements": measurements, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+        write_json_atomic(cache_path, entries)
+    except Exception as e:
+        logging.error("'store_autotune_cache'方法錯誤，無法儲存自動調整結果：{}".format(e))
+
+
+def autotune_profile(window_layout_str:str, target_fps:float, backend:str="torch", backend_options:dict=None,
+                     frame_shape:tuple=(720, 1280, 3), warmup:int=2, runs:int=5, cache_path:str=AUTOTUNE_CACHE_PATH) -> tuple:
+    """由最準確的設定開始量測延遲，選擇第一個達到目標 FPS 的設定，都達不到時選擇最快的設定。
+    只量測整張拼接畫面的推論，模型在量測後直接沿用，不會重新載入。
+    同一台電腦、佈局、目標 FPS 與推論後端已經量測過時直接沿用快取的結果，不再量測
+
+    Args:
+        window_layout_str (str): 視窗佈局
+        target_fps (float): 目標 FPS
+        backend (str): 推論後端
+        backend_options (dict, optional): 推論後端的設定
+        frame_shape (tuple): 量測用影像的大小
+        warmup (int): 暖機次數
+        runs (int): 量測次數
+        cache_path (str, optional): 自動調整快取的路徑，None 表示不使用快取
+
+    Returns:
+        tuple: (設定, 推論後端, {設定說明: 延遲秒數})，沿用快取時推論後端尚未載入模型
+    """
+    key = autotune_cache_key(window_layout_str, target_fps, backend, backend_options)
+    if cache_path:
+        cached = lookup_autotune_cache(key, window_layout_str, cache_path)
+        if cached is not None:
+            logging.info("沿用自動調整快取：{}".format(cached["profile"]))
+            return dict(cached["profile"]), build_backend(cached["profile"], backend, backend_options), cached["measurements"]
+    measurements = {}
+    profile = None
+    inference_backend = None
+    for profile in layout_profiles(window_layout_str):
+        # 同一個 PyTorch 模型只改變輸入大小時，沿用已載入的模型
+        if inference_backend is None or backend == OnnxBackend.name or inference_backend.weights_path != profile["weights"]:
+            inference_backend = build_backend(profile, backend, backend_options)
+        latency = measure_latency(inference_backend.load(), profile["imgsz"], frame_shape, warmup, runs)
+        measurements["{}@{}".format(profile["weights"], profile["imgsz"])] = latency
+        if latency > 0 and 1.0 / latency >= target_fps:
+            break
+    if cache_path:
+        store_autotune_cache(key, profile, measurements, cache_path)
+    return dict(profile), inference_backend, measurements
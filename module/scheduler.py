@@ -0,0 +1,105 @@
+# scheduler.py
+# 用途：推論的影像排程，依照實際延遲調整推論間隔，畫面有車輛時提高推論頻率，沒有時降到閒置頻率
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import threading
+from collections import deque
+
+
+class FrameScheduler:
+    """量測每張影像從擷取到處理完成的延遲，決定下一張影像前要等待多久。
+    有活動（畫面有車輛）時以 active_fps 推論，活動結束 active_hold 秒後降為 idle_fps；
+    延遲超過目標間隔時不再額外等待（只讓出 min_sleep 秒），避免排程落後時越積越多
+    """
+    def __init__(self, active_fps:float=10.0, idle_fps:float=2.0, active_hold:float=3.0, smoothing:float=0.2,
+                 min_sleep:float=0.005, fps_window:float=5.0):
+        """
+        Args:
+            active_fps (float): 有活動時的目標 FPS
+            idle_fps (float): 閒置時的目標 FPS
+            active_hold (float): 活動結束後維持 active_fps 的秒數
+            smoothing (float): 延遲指數移動平均的權重，越大越重視最新的延遲
+            min_sleep (float): 每張影像之間最少讓出的秒數，讓擷取與 GUI 執行緒有機會執行
+            fps_window (float): 計算實際 FPS 的時間窗（秒）
+        """
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.active_hold = active_hold
+        self.smoothing = smoothing
+        self.min_sleep = min_sleep
+        self.fps_window = fps_window
+        self.latency = None # 處理延遲的指數移動平均（秒）
+        self.end_to_end = None # 從擷取到處理完成的延遲的指數移動平均（秒）
+        self.last_activity = None # 上一次有活動的時間
+        self.frame_times = deque() # 時間窗內處理完成的時間
+        self.lock = threading.Lock() # 推論執行緒更新、GUI 執行緒讀取統計
+
+    def is_active(self, now:float=None) -> bool:
+        """是否處於活動狀態"""
+        now = time.monotonic() if now is None else now
+        return self.last_activity is not None and now - self.last_activity < self.active_hold
+
+    def target_fps(self, now:float=None) -> float:
+        """目前的目標 FPS"""
+        return self.active_fps if self.is_active(now) else self.idle_fps
+
+    def smooth(self, average:float, value:float) -> float:
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def frame_done(self, start:float, active:bool, captured:float=None, now:float=None) -> None:
+        """記錄一張影像處理完成
+
+        Args:
+            start (float): 開始處理的時間（time.monotonic）
+            active (bool): 這張影像是否有活動
+            captured (float, optional): 影像擷取的時間（time.monotonic），用於計算從擷取到處理完成的延遲
+            now (float, optional): 處理完成的時間
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.latency = self.smooth(self.latency, now - start)
+            if captured is not None:
+                self.end_to_end = self.smooth(self.end_to_end, now - captured)
+            if active:
+                self.last_activity = now
+            self.frame_times.append(now)
+            while self.frame_times and now - self.frame_times[0] > self.fps_window:
+                self.frame_times.popleft()
+
+    def next_delay(self, start:float, now:float=None) -> float:
+        """距離下一張影像應等待的秒數
+
+        Args:
+            start (float): 這一輪開始處理的時間
+            now (float, optional): 目前時間
+        """
+        now = time.monotonic() if now is None else now
+        interval = 1.0 / self.target_fps(now)
+        return max(self.min_sleep, interval - (now - start))
+
+    def achieved_fps(self, now:float=None) -> float:
+        """時間窗內實際處理的 FPS"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            recent = [frame_time for frame_time in self.frame_times if now - frame_time <= self.fps_window]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(recent[-1] - recent[0], 1e-6)
+
+    def stats(self) -> dict:
+        """排程統計：模式、目標與實際 FPS、平均延遲，以及以延遲估計的最大 FPS"""
+        now = time.monotonic()
+        latency = self.latency
+        end_to_end = self.end_to_end
+        return {
+            "mode": "活動" if self.is_active(now) else "閒置",
+            "target_fps": self.target_fps(now),
+            "achieved_fps": self.achieved_fps(now),
+            "latency_ms": latency * 1000 if latency is not None else 0.0,
+            "end_to_end_ms": end_to_end * 1000 if end_to_end is not None else 0.0,
+            "max_fps": 1.0 / latency if latency else 0.0,
+        }
@@ -0,0 +1,116 @@
+# track.py
+# 用途：車輛追蹤資料的儲存，以到期時間的優先佇列回收離開畫面的車輛
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import time
+import heapq
+
+
+# 定義 Vehicle 類別以表示檢測到的車輛
+class Vehicle:
+    # 使用 __slots__ 取代 __dict__，減少大量車輛時的記憶體與屬性存取成本
+    __slots__ = ("vehicle_id", "vehicle_type", "position", "first_seen", "last_seen", "stay_frames", "zone_id")
+
+    def __init__(self, vehicle_id:int, vehicle_type:str, position:tuple, now:float=None):
+        now = time.monotonic() if now is None else now
+        self.vehicle_id = vehicle_id
+        self.vehicle_type = vehicle_type
+        self.position = position
+        self.first_seen = now # 第一次偵測到的時間（time.monotonic）
+        self.last_seen = now # 最後偵測到的時間（time.monotonic）
+        self.stay_frames = 1 # 停留幀數
+        self.zone_id = None # 所屬框框 ID
+
+    def update_info(self, new_position:tuple, now:float=None) -> None :
+        """跟新車輛位置和最後偵測到的時間
+
+        Args:
+            new_position (tuple): 新的車輛位置
+            now (float, optional): 目前時間（time.monotonic），同一張影像的車輛共用一次取得的時間
+        """
+        self.position = new_position
+        self.last_seen = time.monotonic() if now is None else now
+        self.stay_frames += 1
+
+
+class TrackStore:
+    """車輛追蹤資料。每台車在到期佇列中只有一筆 (到期時間, 車輛 ID)，
+    回收時只需要檢查已經到期的項目，成本為 O(到期數量 log n)，而不是每張影像掃描所有車輛
+    """
+    def __init__(self, limit_time:float):
+        """
+        Args:
+            limit_time (float): 車輛離開畫面多少秒後刪除
+        """
+        self.limit_time = limit_time
+        self.vehicles = {} # {車輛 ID: Vehicle}
+        self.zones = {} # {框框 ID: set(車輛 ID)}
+        self.expiry_heap = [] # [(到期時間, 車輛 ID)]
+        self.alive_floor = float("-inf") # 所有車輛至少視為在此時間被看到，用於畫面沒變化時延長存活
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
+
+    def __contains__(self, vehicle_id) -> bool:
+        return vehicle_id in self.vehicles
+
+    def __getitem__(self, vehicle_id) -> Vehicle:
+        return self.vehicles[vehicle_id]
+
+    def values(self):
+        return self.vehicles.values()
+
+    def add(self, vehicle:Vehicle) -> None:
+        """新增車輛並排入到期佇列"""
+        self.vehicles[vehicle.vehicle_id] = vehicle
+        heapq.heappush(self.expiry_heap, (vehicle.last_seen + self.limit_time, vehicle.vehicle_id))
+
+    def set_zone(self, vehicle_id, zone_id) -> None:
+        """設定車輛所屬框框，並更新框框的成員"""
+        vehicle = self.vehicles[vehicle_id]
+        if vehicle.zone_id is not None:
+            self.zones.get(vehicle.zone_id, set()).discard(vehicle_id)
+        vehicle.zone_id = zone_id
+        if zone_id is not None:
+            self.zones.setdefault(zone_id, set()).add(vehicle_id)
+
+    def zone_members(self, zone_id) -> set:
+        """取得目前位於某個框框的車輛 ID"""
+        return self.zones.get(zone_id, set())
+
+    def keep_alive(self, now:float) -> None:
+        """將所有車輛視為在 now 時被看到，O(1)，不需要逐一更新車輛"""
+        self.alive_floor = now
+
+    def remove(self, vehicle_id) -> Vehicle:
+        """刪除車輛，並從所屬框框移除"""
+        vehicle = self.vehicles.pop(vehicle_id)
+        if vehicle.zone_id is not None:
+            self.zones.get(vehicle.zone_id, set()).discard(vehicle_id)
+        return vehicle
+
+    def collect(self, now:float) -> list:
+        """回收已經超過 limit_time 沒有被看到的車輛
+
+        Args:
+            now (float): 目前時間（time.monotonic）
+
+        Returns:
+            list: 被刪除的 Vehicle
+        """
+        removed = []
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            _, vehicle_id = heapq.heappop(self.expiry_heap)
+            vehicle = self.vehicles.get(vehicle_id)
+            if vehicle is None:
+                continue
+            # 佇列中的到期時間可能已經過時（車輛之後又被看到），以實際時間重新計算
+            deadline = max(vehicle.last_seen, self.alive_floor) + self.limit_time
+            if deadline <= now:
+                removed.append(self.remove(vehicle_id))
+            else:
+                heapq.heappush(self.expiry_heap, (deadline, vehicle_id))
+        return removed
@@ -0,0 +1,159 @@
+# zone.py
+# 用途：框框（區塊）索引與覆蓋層，一次判斷所有車輛落在哪個框框，並快取框框的繪製結果
+import sys
+import os
+# 將目錄切換至根目錄
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import cv2
+
+
+class ZoneIndex:
+    """由框框配置建立一次的索引。
+    框框排成規則網格（例如 2x2、3x3、4x4）時，以每一欄/列的邊界做二分搜尋直接算出所在格子；
+    任意配置時，則以所有車輛對所有框框的向量化點在框內判斷
+    """
+    def __init__(self, boxes:dict):
+        """
+        Args:
+            boxes (dict): {框框 ID: [x0, y0, x1, y1]}
+        """
+        self.zone_ids = list(boxes.keys())
+        self.boxes = np.array([list(box) for box in boxes.values()], dtype=np.float64).reshape(-1, 4)
+        self.grid = self.build_grid()
+
+    def build_grid(self):
+        """檢查框框是否為規則網格，是的話建立欄/列邊界與格子對照表
+
+        Returns:
+            tuple: (欄左邊界, 欄右邊界, 列上邊界, 列下邊界, 格子對照表)，不是規則網格時回傳 None
+        """
+        if len(self.boxes) == 0:
+            return None
+        columns = sorted(set(map(tuple, self.boxes[:, [0, 2]])))
+        rows = sorted(set(map(tuple, self.boxes[:, [1, 3]])))
+        if len(columns) * len(rows) != len(self.boxes):
+            return None
+        # 欄與列彼此不能重疊，否則二分搜尋的結果不唯一
+        for intervals in (columns, rows):
+            for (_, previous_end), (start, _) in zip(intervals, intervals[1:]):
+                if start < previous_end:
+                    return None
+        column_of = {interval: index for index, interval in enumerate(columns)}
+        row_of = {interval: index for index, interval in enumerate(rows)}
+        table = np.full((len(rows), len(columns)), -1, dtype=np.int64)
+        for zone_index, (x0, y0, x1, y1) in enumerate(self.boxes):
+            row, column = row_of[(y0, y1)], column_of[(x0, x1)]
+            if table[row, column] != -1:
+                return None
+            table[row, column] = zone_index
+        column_edges = np.array(columns)
+        row_edges = np.array(rows)
+        return column_edges[:, 0], column_edges[:, 1], row_edges[:, 0], row_edges[:, 1], table
+
+    def locate(self, centers:np.ndarray) -> np.ndarray:
+        """判斷每個中心點落在哪個框框
+
+        Args:
+            centers (np.ndarray): 形狀為 (N, 2) 的中心點座標
+
+        Returns:
+            np.ndarray: 形狀為 (N,) 的框框索引，不在任何框框內為 -1
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if len(centers) == 0 or len(self.boxes) == 0:
+            return np.full(len(centers), -1, dtype=np.int64)
+        center_x, center_y = centers[:, 0], centers[:, 1]
+        if self.grid is not None:
+            column_starts, column_ends, row_starts, row_ends, table = self.grid
+            columns = np.searchsorted(column_starts, center_x, side="right") - 1
+            rows = np.searchsorted(row_starts, center_y, side="right") - 1
+            valid = (columns >= 0) & (rows >= 0)
+            columns_clipped, rows_clipped = np.clip(columns, 0, None), np.clip(rows, 0, None)
+            valid &= (center_x <= column_ends[columns_clipped]) & (center_y <= row_ends[rows_clipped])
+            return np.where(valid, table[rows_clipped, columns_clipped], -1)
+        # 任意配置：(N, M) 的點在框內矩陣，取第一個符合的框框
+        x0, y0, x1, y1 = (self.boxes[:, k][None, :] for k in range(4))
+        inside = (x0 <= center_x[:, None]) & (center_x[:, None] <= x1) & (y0 <= center_y[:, None]) & (center_y[:, None] <= y1)
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def assign(self, positions:list) -> list:
+        """依照車輛位置的中心點判斷所屬框框 ID
+
+        Args:
+            positions (list): [(x0, y0, x1, y1), ...] 車輛位置
+
+        Returns:
+            list: 每台車輛的框框 ID，不在任何框框內為 None
+        """
+        if not positions:
+            return []
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 4)
+        centers = np.column_stack(((positions[:, 0] + positions[:, 2]) / 2, (positions[:, 1] + positions[:, 3]) / 2))
+        return [self.zone_ids[index] if index >= 0 else None for index in self.locate(centers)]
+
+
+class GridOverlay:
+    """框框與 ID 標籤的靜態覆蓋層。
+    框框不變時只在第一次（或影像大小改變時）繪製一次，之後每張影像只做一次向量化的像素複製
+    """
+    def __init__(self, boxes:dict, color:tuple=(0, 255, 0)):
+        """
+        Args:
+            boxes (dict): {框框 ID: [x0, y0, x1, y1]}
+            color (tuple): 框框與標籤的 BGR 顏色
+        """
+        self.boxes = boxes
+        self.color = color
+        self.shape = None # 覆蓋層對應的影像大小
+        self.indices = None # 覆蓋層像素在攤平影像中的索引
+        self.colors = None # 覆蓋層像素的顏色
+        self.mask = None # 覆蓋層遮罩，影像不連續時使用
+        self.blend_indices = None # 需要混色的邊緣像素索引
+        self.blend_alpha = None # 邊緣像素的透明度
+
+    def build(self, shape:tuple) -> None:
+        """依照影像大小繪製覆蓋層
+
+        Args:
+            shape (tuple): 影像的 (高, 寬, 通道數)
+        """
+        layer = np.zeros(shape, dtype=np.uint8)
+        for location_id, box in self.boxes.items():
+            x0, y0, x1, y1 = (int(value) for value in box)
+            cv2.rectangle(layer, (x0, y0), (x1, y1), self.color, 2)
+            # 計算框框的中心點
+            center_x = x0 + (x1 - x0) // 2
+            center_y = y0 + (y1 - y0) // 2
+            cv2.putText(layer, "ID:{}".format(location_id), (center_x, center_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self.color, 2)
+        # 覆蓋層只有一種顏色，以像素亮度換算透明度；部分版本的 putText 會反鋸齒，邊緣像素需要混色
+        alpha = layer.max(axis=2).astype(np.float32) / max(max(self.color), 1)
+        flat_alpha = alpha.reshape(-1)
+        self.mask = alpha >= 1
+        self.indices = np.flatnonzero(self.mask)
+        self.colors = np.array(self.color, dtype=np.uint8)
+        self.blend_indices = np.flatnonzero((flat_alpha > 0) & (flat_alpha < 1))
+        self.blend_alpha = flat_alpha[self.blend_indices][:, None]
+        self.shape = shape
+
+    def apply(self, frame:np.ndarray) -> np.ndarray:
+        """將覆蓋層合成到影像上（原地修改）
+
+        Args:
+            frame (np.ndarray): BGR 影像
+
+        Returns:
+            np.ndarray: 合成後的影像
+        """
+        if self.shape != frame.shape:
+            self.build(frame.shape)
+        if not frame.flags["C_CONTIGUOUS"]:
+            frame[self.mask] = self.colors
+            return frame
+        pixels = frame.reshape(-1, frame.shape[2])
+        pixels[self.indices] = self.colors
+        if len(self.blend_indices):
+            blended = pixels[self.blend_indices] * (1 - self.blend_alpha) + self.colors * self.blend_alpha
+            pixels[self.blend_indices] = blended.astype(np.uint8)
+        return frame
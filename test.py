@@ -21,7 +21,7 @@ def main():
 
         results, anno_frame = detection_manager.detect(img)  # 進行車輛檢測
 
-        cv2.imshow("副視窗", anno_frame)
+        cv2.imshow("副視窗", anno_frame.render())  # 只有顯示時才繪製標註影像
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
@@ -100,9 +100,19 @@ class Ui_MainWindow(object):
         self.action_cuda_info.setFont(font)
         self.action_cuda_info.setObjectName("actionmodelinfo")
 
+        self.action_profiler=QAction(QIcon('icons/help.png'), 'profile...', MainWindow)
+        self.action_profiler.setShortcut('Ctrl+Shift+P')
+        self.action_profiler.setStatusTip('start or stop the sampling profiler')
+        self.action_profiler.setCheckable(True)
+        font = QtGui.QFont()
+        font.setPointSize(11)
+        self.action_profiler.setFont(font)
+        self.action_profiler.setObjectName("actionprofiler")
+
         #按鈕連接
         self.menuhelp.addAction(self.action_system_info)
         self.menuhelp.addAction(self.action_cuda_info)
+        self.menuhelp.addAction(self.action_profiler)
 
         #按鈕連接
         self.menubar.addAction(self.menuhelp.menuAction())